@@ -1,28 +1,16 @@
 import os
 from langchain_google_genai import ChatGoogleGenerativeAI
 from crewai import Agent, LLM
-from tools import(
-    search_tool,
-    FinancialDocumentTool,
-    FinancialAnalysisTool,
-    RiskAssessmentTool,
-    InvestmentAnalysisTool,
-    VerificationAndSynthesisTool
-)
-
-document_tool = FinancialDocumentTool()
-financial_tool = FinancialAnalysisTool()
-risk_tool = RiskAssessmentTool()
-investment_tool = InvestmentAnalysisTool()
-verification_tool = VerificationAndSynthesisTool()
+from llm_cache import CachedLLM
+from tools import DocumentSearchTool, FinancialDocumentTool
 
 from dotenv import load_dotenv
 load_dotenv(override=True)
 
 
-llm = LLM(
+llm = CachedLLM(
     api_key=os.getenv("GEMINI_API_KEY"),
-    model="gemini/gemini-1.5-pro-002",
+    model=os.getenv("LLM_MODEL", "gemini/gemini-1.5-pro-002"),
     temperature=0.3,
     max_tokens=8192,
     top_p=0.9,
@@ -31,74 +19,86 @@ llm = LLM(
 )
 
 
-financial_analyst=Agent(
-    role="Senior Financial Analyst",
-    goal=(
-        "Provide insightful, data-driven investment analysis based on financial documents. "
-        "Your analysis must be clear and directly supported by evidence from the text."
+def build_agents(llm=llm) -> dict:
+    """
+    Build a fresh set of the four agents with their own tool instances.
+    Each crew in the worker pool gets its own set so no mutable state is shared between jobs.
+    """
+    financial_analyst=Agent(
+        role="Senior Financial Analyst",
+        goal=(
+            "Provide insightful, data-driven investment analysis based on financial documents. "
+            "Your analysis must be clear and directly supported by evidence from the text."
+            ),
+        verbose=True,
+        memory=True,
+        backstory=(
+            "As a seasoned financial analyst with over 15 years of experience at a top-tier "
+            "investment firm, you have a proven track record of identifying lucrative investment "
+            "opportunities and mitigating risks. You specialize in dissecting complex financial "
+            "statements to uncover the true health and potential of a company. Your reports are "
+            "highly valued for their clarity, accuracy, and actionable recommendations."
         ),
-    verbose=True,
-    memory=True,
-    backstory=(
-        "As a seasoned financial analyst with over 15 years of experience at a top-tier "
-        "investment firm, you have a proven track record of identifying lucrative investment "
-        "opportunities and mitigating risks. You specialize in dissecting complex financial "
-        "statements to uncover the true health and potential of a company. Your reports are "
-        "highly valued for their clarity, accuracy, and actionable recommendations."
-    ),
-    tools=[document_tool],
-    llm=llm,
-    allow_delegation=False 
-)
+        tools=[DocumentSearchTool(), FinancialDocumentTool()],
+        llm=llm,
+        allow_delegation=False 
+    )
 
-risk_assessor = Agent(
-    role="Financial Risk Assessor",
-    goal="Identify, quantify, and report on all pertinent financial and market risks discovered in the provided documents and analysis.",
-    verbose=True,
-    backstory=(
-        "With a background in quantitative analysis and financial modeling, you excel at identifying "
-        "potential downsides and market volatility. Your job is to provide a clear, unbiased, and "
-        "data-supported view of the risks associated with any financial entity or investment, ensuring "
-        "that all potential threats are brought to light."
-    ),
-    tools=[document_tool],
-    llm=llm,
-    allow_delegation=False
-)
+    risk_assessor = Agent(
+        role="Financial Risk Assessor",
+        goal="Identify, quantify, and report on all pertinent financial and market risks discovered in the provided documents and analysis.",
+        verbose=True,
+        backstory=(
+            "With a background in quantitative analysis and financial modeling, you excel at identifying "
+            "potential downsides and market volatility. Your job is to provide a clear, unbiased, and "
+            "data-supported view of the risks associated with any financial entity or investment, ensuring "
+            "that all potential threats are brought to light."
+        ),
+        tools=[DocumentSearchTool(), FinancialDocumentTool()],
+        llm=llm,
+        allow_delegation=False
+    )
 
 
-investment_advisor = Agent(
-    role="Investment Strategy Advisor",
-    goal="Develop tailored, data-driven investment strategies and recommendations based on the financial analysis and risk assessment.",
-    verbose=True,
-    backstory=(
-        "You are a client-focused investment advisor with deep experience in portfolio management. "
-        "You specialize in translating complex financial data and risk profiles into clear, actionable "
-        "investment strategies. Your recommendations are always grounded in a thorough understanding "
-        "of the financial landscape and the specific context provided by the analysis."
-    ),
-    tools=[document_tool],
-    llm=llm,
-    allow_delegation=False
-)
+    investment_advisor = Agent(
+        role="Investment Strategy Advisor",
+        goal="Develop tailored, data-driven investment strategies and recommendations based on the financial analysis and risk assessment.",
+        verbose=True,
+        backstory=(
+            "You are a client-focused investment advisor with deep experience in portfolio management. "
+            "You specialize in translating complex financial data and risk profiles into clear, actionable "
+            "investment strategies. Your recommendations are always grounded in a thorough understanding "
+            "of the financial landscape and the specific context provided by the analysis."
+        ),
+        tools=[DocumentSearchTool(), FinancialDocumentTool()],
+        llm=llm,
+        allow_delegation=False
+    )
+
 
+    verifier = Agent(
+        role="Lead Verification Specialist",
+        goal=(
+            "Ensure the absolute accuracy and logical consistency of financial reports. "
+            "You must cross-reference every claim and data point in the analyst's report "
+            "against the original source document."
+        ),
+        verbose=True,
+        memory=True,
+        backstory=(
+            "With a meticulous eye for detail and a background in financial auditing and compliance, "
+            "you are the last line of defense before a report is finalized. Your job is to be skeptical, "
+            "challenge assumptions, and ensure that every piece of analysis is flawlessly supported "
+            "by the provided data. You are known for your rigor and unwavering commitment to accuracy."
+        ),
+        tools=[DocumentSearchTool(), FinancialDocumentTool()], 
+        llm=llm,
+        allow_delegation=False
+    )
 
-verifier = Agent(
-    role="Lead Verification Specialist",
-    goal=(
-        "Ensure the absolute accuracy and logical consistency of financial reports. "
-        "You must cross-reference every claim and data point in the analyst's report "
-        "against the original source document."
-    ),
-    verbose=True,
-    memory=True,
-    backstory=(
-        "With a meticulous eye for detail and a background in financial auditing and compliance, "
-        "you are the last line of defense before a report is finalized. Your job is to be skeptical, "
-        "challenge assumptions, and ensure that every piece of analysis is flawlessly supported "
-        "by the provided data. You are known for your rigor and unwavering commitment to accuracy."
-    ),
-    tools=[document_tool], 
-    llm=llm,
-    allow_delegation=False
-)
\ No newline at end of file
+    return {
+        "financial_analyst": financial_analyst,
+        "risk_assessor": risk_assessor,
+        "investment_advisor": investment_advisor,
+        "verifier": verifier,
+    }
@@ -0,0 +1,209 @@
+"""
+Offline end-to-end throughput benchmark.
+
+Drives POST /analyze -> run_crew_task -> GET /results in process, with a stub LLM
+and synthetic PDFs, and reports jobs/sec and latency percentiles per concurrency
+level as JSON. The Celery broker is replaced by a local green thread pool standing in
+for Redis plus an eventlet worker, so nothing leaves the machine. The process is
+monkey-patched like the worker unless --no-eventlet is given.
+
+    python -m benchmarks.bench_pipeline --concurrency 1 4 8 --jobs 16 --pages 5 50 200
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8], help="Concurrent clients per level")
+    parser.add_argument("--jobs", type=int, default=16, help="Jobs submitted per concurrency level")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 50, 200], help="Page counts of the synthetic PDFs, used round-robin")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds the stub LLM sleeps per call")
+    parser.add_argument("--workers", type=int, default=None, help="Stand-in worker threads (default: max concurrency)")
+    parser.add_argument("--no-eventlet", dest="eventlet", action="store_false", help="Run jobs on OS threads without monkey-patching")
+    parser.add_argument("--warm-cache", action="store_true", help="Reuse one PDF per page count instead of unique documents per job")
+    parser.add_argument("--allow-dedup", action="store_true", help="Submit identical queries so result deduplication can kick in")
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--output", default="bench_pipeline.json")
+    return parser.parse_args()
+
+
+def configure_environment(workdir: Path):
+    """Point every store at a scratch directory before the app modules are imported."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["UPLOAD_DIR"] = str(workdir / "data")
+    os.environ["OUTPUT_DIR"] = str(workdir / "outputs")
+    os.environ["EXTRACTION_CACHE_DIR"] = str(workdir / "data" / "cache")
+    os.environ["LLM_CACHE_MODE"] = "off"
+    # No shared Redis budget offline; the stub LLM has no rate limit
+    os.environ["LLM_TOKENS_PER_MINUTE"] = "0"
+    os.environ["LLM_REQUESTS_PER_MINUTE"] = "0"
+    os.environ.setdefault("GEMINI_API_KEY", "offline")
+    os.environ.setdefault("SERPER_API_KEY", "offline")
+
+
+class LocalWorker:
+    """
+    Stands in for Redis + a Celery worker: enqueuing runs the task body on a green thread
+    pool, like `celery worker -P eventlet`, or on a thread pool when not monkey-patched.
+    """
+
+    def __init__(self, task, workers: int, green: bool = True):
+        self.task = task
+        if green:
+            import eventlet
+            self.pool = eventlet.GreenPool(workers)
+            self.executor = None
+        else:
+            self.pool = None
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bench-worker")
+
+    def enqueue_analysis(self, task_id: str, query: str, file_path: str, queue: str = None):
+        if self.pool is not None:
+            return self.pool.spawn(self.task.run, task_id, query, file_path)
+        return self.executor.submit(self.task.run, task_id, query, file_path)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+async def run_job(client, pdf: bytes, query: str, poll_interval: float) -> tuple:
+    started = time.perf_counter()
+    response = await client.post(
+        "/analyze",
+        files={"file": ("bench.pdf", pdf, "application/pdf")},
+        data={"query": query},
+    )
+    response.raise_for_status()
+    body = response.json()
+    task_id = body["task_id"]
+    status = body.get("status", "PENDING")
+    while status == "PENDING":
+        await asyncio.sleep(poll_interval)
+        result = await client.get(f"/results/{task_id}")
+        status = result.json()["status"]
+    return time.perf_counter() - started, status
+
+
+async def run_level(client, documents: list, concurrency: int, jobs: int, args) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(index):
+        nonlocal failures
+        async with semaphore:
+            pdf = documents[index % len(documents)]
+            query = "Analyze this financial document for investment insights"
+            if not args.allow_dedup:
+                query += f" [benchmark c{concurrency} job {index}]"
+            latency, status = await run_job(client, pdf, query, args.poll_interval)
+            latencies.append(latency)
+            if status != "SUCCESS":
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(jobs)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "jobs": jobs,
+        "failures": failures,
+        "wall_seconds": elapsed,
+        "jobs_per_second": jobs / elapsed if elapsed else 0.0,
+        "latency_seconds": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "mean": sum(latencies) / len(latencies) if latencies else float("nan"),
+            "max": latencies[-1] if latencies else float("nan"),
+        },
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main_async(args):
+    workdir = Path(tempfile.mkdtemp(prefix="bench-pipeline-"))
+    configure_environment(workdir)
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+    # Imported only now so they pick up the scratch configuration
+    import httpx
+    import main
+    import celery_tasks
+    from crew_pool import crew_pool
+    from benchmarks.fake_llm import StubLLM
+    from benchmarks.synthetic_pdf import build_pdf
+
+    workers = args.workers or max(args.concurrency)
+    stub_llm = StubLLM(latency_seconds=args.llm_latency)
+    crew_pool.configure(size=workers, llm=stub_llm)
+    main.enqueue_analysis = LocalWorker(celery_tasks.run_crew_task, workers, green=args.eventlet).enqueue_analysis
+
+    levels = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrency in args.concurrency:
+            if args.warm_cache:
+                documents = [build_pdf(pages, seed=pages) for pages in args.pages]
+            else:
+                # Unique bytes per job so every job pays for extraction
+                documents = [build_pdf(args.pages[i % len(args.pages)], seed=concurrency * 100000 + i) for i in range(args.jobs)]
+            level = await run_level(client, documents, concurrency, args.jobs, args)
+            levels.append(level)
+            print(
+                f"concurrency={concurrency}: {level['jobs_per_second']:.2f} jobs/s, "
+                f"p50={level['latency_seconds']['p50']:.2f}s p95={level['latency_seconds']['p95']:.2f}s "
+                f"p99={level['latency_seconds']['p99']:.2f}s failures={level['failures']}"
+            )
+
+    report = {
+        "benchmark": "pipeline",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "jobs": args.jobs,
+            "pages": args.pages,
+            "llm_latency_seconds": args.llm_latency,
+            "workers": workers,
+            "eventlet": args.eventlet,
+            "warm_cache": args.warm_cache,
+            "allow_dedup": args.allow_dedup,
+        },
+        "llm_calls": stub_llm.calls,
+        "levels": levels,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.eventlet:
+        # Patched before the app is imported, as celery_tasks does in the worker, so jobs
+        # share one OS thread and the CPU pool offloads exactly as in production
+        import eventlet
+        eventlet.monkey_patch()
+    asyncio.run(main_async(args))
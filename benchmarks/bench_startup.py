@@ -0,0 +1,100 @@
+"""
+API start-up benchmark: import time and peak RSS of `main` in fresh interpreters.
+
+Exits non-zero if any of the crew stack (crewai, litellm, agents, tools, ...) is
+imported by the API process or a time/RSS budget is exceeded, so it can guard
+against regressions in CI. Pass `--module celery_tasks` to see the worker's cost.
+
+    python -m benchmarks.bench_startup --runs 5 --max-seconds 3 --max-rss-mb 250
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CREW_STACK = ("crewai", "crewai_tools", "litellm", "langchain_core", "agents", "task", "tools", "crew_pool", "celery_tasks")
+
+_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+loaded = sorted({{name.split(".")[0] for name in sys.modules}} & set({forbidden!r}))
+print(json.dumps({{"seconds": seconds, "peak_rss_mb": peak_rss_mb, "forbidden_loaded": loaded}}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Module to import (default: the API)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail if the median import time is above this")
+    parser.add_argument("--max-rss-mb", type=float, default=None, help="Fail if the median peak RSS is above this")
+    parser.add_argument("--allow-crew-stack", action="store_true", help="Don't fail when crew modules are imported")
+    parser.add_argument("--output", default="bench_startup.json")
+    return parser.parse_args()
+
+
+def probe(module: str, env: dict) -> dict:
+    code = _PROBE.format(module=module, forbidden=CREW_STACK)
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    # The module may print on import; the probe's JSON is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    workdir = Path(tempfile.mkdtemp(prefix="bench-startup-"))
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{workdir / 'bench.db'}",
+        "UPLOAD_DIR": str(workdir / "data"),
+        "OUTPUT_DIR": str(workdir / "outputs"),
+        "EXTRACTION_CACHE_DIR": str(workdir / "data" / "cache"),
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+
+    # One unmeasured run so every measured run sees the same warm bytecode and page cache
+    probe(args.module, env)
+    runs = [probe(args.module, env) for _ in range(args.runs)]
+    seconds = sorted(run["seconds"] for run in runs)
+    rss = sorted(run["peak_rss_mb"] for run in runs)
+    forbidden = sorted({name for run in runs for name in run["forbidden_loaded"]})
+    report = {
+        "benchmark": "startup",
+        "module": args.module,
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "import_seconds": {"median": statistics.median(seconds), "min": seconds[0], "max": seconds[-1]},
+        "peak_rss_mb": {"median": statistics.median(rss), "min": rss[0], "max": rss[-1]},
+        "crew_stack_loaded": forbidden,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(
+        f"import {args.module}: median {report['import_seconds']['median']:.3f}s, "
+        f"peak RSS {report['peak_rss_mb']['median']:.1f} MB, crew stack loaded: {forbidden or 'none'}"
+    )
+
+    failures = []
+    if forbidden and not args.allow_crew_stack:
+        failures.append(f"crew stack imported: {', '.join(forbidden)}")
+    if args.max_seconds is not None and report["import_seconds"]["median"] > args.max_seconds:
+        failures.append(f"median import time above {args.max_seconds}s")
+    if args.max_rss_mb is not None and report["peak_rss_mb"]["median"] > args.max_rss_mb:
+        failures.append(f"median peak RSS above {args.max_rss_mb} MB")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Deterministic stand-in for the Gemini LLM so the crew can run without network access."""
+import time
+import hashlib
+from crewai.llms.base_llm import BaseLLM
+from llm_limits import llm_slot
+
+
+class StubLLM(BaseLLM):
+    """
+    Answers every request with a fixed-shape final answer after a configurable delay.
+    Takes the same process-wide concurrency slot as the real LLM.
+    """
+
+    def __init__(self, latency_seconds: float = 0.5, model: str = "stub/deterministic"):
+        super().__init__(model=model, temperature=0)
+        self.latency_seconds = latency_seconds
+        self.calls = 0
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        self.calls += 1
+        prompt = messages if isinstance(messages, str) else "".join(str(m.get("content", "")) for m in messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        with llm_slot():
+            time.sleep(self.latency_seconds)
+        return (
+            "Thought: I now know the final answer\n"
+            "Final Answer: # Stub Report\n"
+            f"## Summary\nDeterministic response {digest} for a {len(prompt)} character prompt.\n"
+            "## Key Figures\nTotal revenues were 25,000 in Q2-2025, a gross margin of 18.0%.\n"
+        )
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return True
+
+    def get_context_window_size(self) -> int:
+        return 1_000_000
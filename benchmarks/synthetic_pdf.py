@@ -0,0 +1,76 @@
+"""Deterministic synthetic financial filings as minimal, text-extractable PDFs."""
+import random
+
+PERIODS = ["Q2-2024", "Q3-2024", "Q4-2024", "Q1-2025", "Q2-2025"]
+LINE_ITEMS = [
+    ("Total revenues", 25000),
+    ("Total gross profit", 4500),
+    ("Income from operations", 1600),
+    ("Net income attributable to common stockholders", 1400),
+    ("Net cash provided by operating activities", 3600),
+    ("Capital expenditures", -2300),
+    ("Total current assets", 52000),
+    ("Total current liabilities", 29000),
+    ("Total liabilities", 44000),
+    ("Total stockholders' equity", 66000),
+]
+NARRATIVE = [
+    "Demand remained resilient across our core markets despite pricing pressure.",
+    "We continue to invest in capacity expansion and research and development.",
+    "Supply chain constraints eased during the period, improving delivery times.",
+    "Foreign exchange movements reduced reported revenue growth.",
+    "We expect operating expenses to increase as new facilities ramp.",
+    "Tariffs and trade policy remain a source of uncertainty for our outlook.",
+    "Liquidity is supported by cash and investments and an undrawn credit facility.",
+    "Energy generation and storage deployments reached a record level.",
+]
+LINES_PER_PAGE = 45
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _page_lines(page_number: int, rng: random.Random) -> list:
+    if page_number == 0:
+        lines = ["F I N A N C I A L S U M M A R Y (Unaudited)",
+                 "($ in millions, except percentages) " + " ".join(PERIODS)]
+        for label, base in LINE_ITEMS:
+            values = [base * (1 + rng.uniform(-0.15, 0.15)) for _ in PERIODS]
+            cells = [f"({abs(v):,.0f})" if v < 0 else f"{v:,.0f}" for v in values]
+            lines.append(f"{label} {' '.join(cells)}")
+        return lines
+    heading = "Risk Factors" if page_number % 7 == 0 else f"Management Discussion, Section {page_number}"
+    return [heading] + [rng.choice(NARRATIVE) for _ in range(LINES_PER_PAGE - 1)]
+
+
+def build_pdf(page_count: int, seed: int = 0) -> bytes:
+    """Build a PDF with a statement table on page 1 and narrative text on the rest."""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_number in range(page_count):
+        lines = _page_lines(page_number, rng)
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        content = stream.encode("latin-1")
+        objects.append(b"<< /Length " + str(len(content)).encode() + b" >>\nstream\n" + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
@@ -0,0 +1,48 @@
+"""
+Celery app and the enqueue interface used by the API.
+
+Tasks are addressed by name, so importing this module never loads the crew stack
+(crewai, agents, tools, the LLM); only the worker imports celery_tasks.
+"""
+import os
+from celery import Celery
+from scheduler import BULK_QUEUE, INTERACTIVE_QUEUE
+
+from dotenv import load_dotenv
+load_dotenv()
+
+RUN_CREW_TASK = "celery_tasks.run_crew_task"
+COMBINE_BATCH_REPORTS = "celery_tasks.combine_batch_reports"
+COLLECT_GARBAGE = "celery_tasks.collect_garbage"
+
+GC_INTERVAL_SECONDS = int(os.getenv("GC_INTERVAL_SECONDS", "3600"))
+
+redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Chords need a result backend to know when every document in a batch has finished
+celery = Celery('tasks', broker=redis_url, backend=os.getenv("CELERY_RESULT_BACKEND", redis_url))
+celery.conf.result_expires = int(os.getenv("CELERY_RESULT_EXPIRES", "86400"))
+# Interactive and bulk jobs have their own queues and workers (see docker-compose.yml);
+# one prefetched job per slot so a long job never holds others back
+celery.conf.task_default_queue = INTERACTIVE_QUEUE
+celery.conf.task_routes = {
+    COMBINE_BATCH_REPORTS: {"queue": BULK_QUEUE},
+    COLLECT_GARBAGE: {"queue": BULK_QUEUE},
+}
+celery.conf.worker_prefetch_multiplier = 1
+# Retention and disk quotas, run by the beat service (see retention.py)
+celery.conf.beat_schedule = {
+    "collect-garbage": {"task": COLLECT_GARBAGE, "schedule": GC_INTERVAL_SECONDS},
+}
+
+
+def analysis_signature(task_id: str, query: str, file_path: str, queue: str = INTERACTIVE_QUEUE):
+    return celery.signature(RUN_CREW_TASK, args=(task_id, query, file_path), queue=queue, immutable=True)
+
+
+def combine_signature(batch_id: str):
+    return celery.signature(COMBINE_BATCH_REPORTS, args=(batch_id,), immutable=True)
+
+
+def enqueue_analysis(task_id: str, query: str, file_path: str, queue: str = INTERACTIVE_QUEUE):
+    """Send one analysis job to the workers."""
+    return analysis_signature(task_id, query, file_path, queue).apply_async()
@@ -1,75 +1,365 @@
 import sys
 import os
+import time
+import queue
+import threading
 
 if 'celery' in sys.argv[0] and 'worker' in sys.argv:
     import eventlet
     eventlet.monkey_patch()
 
-from celery import Celery
-from crewai import Crew, Process
+from celery.exceptions import Retry
+from celery.signals import worker_ready, worker_shutdown
 from sqlalchemy.orm import Session
-from agents import financial_analyst, verifier, investment_advisor, risk_assessor
-from task import financial_analysis, verification, investment_analysis, risk_assessment
+from crew_pool import crew_pool
 from database import SessionLocal
+from dedup import settle_duplicates
+from result_store import write_result_artifact
+from progress import QUEUED_STAGE, record_partial_result, record_stage, publish_completion
+from text_pipeline import cache_document
+from cross_check import demote_headings, format_partial_report, format_verified_report, merge_checks
+import cpu_pool
+from cpu_pool import CPU_WORKERS, offload_enabled, run_cpu
+from document_jobs import cross_check_job, fact_sheet_job, revision_job
+from page_store import NO_REVISION_SUMMARY, format_change_summary
+from metrics import STAGE_SECONDS, span, start_worker_exporter, timed
+from scheduler import INTERACTIVE_QUEUE, estimate_cost, llm_budget, retry_delay
+from celery_app import COLLECT_GARBAGE, COMBINE_BATCH_REPORTS, RUN_CREW_TASK, celery
+from retention import collect_garbage as run_garbage_collection
+from datetime import datetime
 import models
+from models import TaskStatus
 from dotenv import load_dotenv
 load_dotenv()
 
-redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-celery = Celery('tasks', broker=redis_url)
 
-@celery.task
-def run_crew_task(task_id: str, query: str, file_path: str):
+@worker_ready.connect
+def warm_crew_pool(**kwargs):
+    """Pre-build the worker's crews before the first job arrives."""
+    start_worker_exporter()
+    crew_pool.warm()
+    print(f"Crew pool warmed with {crew_pool.size} crews")
+    if offload_enabled():
+        cpu_pool.warm()
+        print(f"CPU-bound stages run on a pool of {CPU_WORKERS} processes")
+
+
+@worker_shutdown.connect
+def stop_cpu_pool(**kwargs):
+    cpu_pool.shutdown()
+
+
+SPECIALIST_STAGES = ("financial_analysis", "risk_assessment", "investment_analysis")
+# How often the combine step looks again while a deduplicated document's run is still going
+BATCH_COMBINE_RETRY_SECONDS = int(os.getenv("BATCH_COMBINE_RETRY_SECONDS", "30"))
+# Skip the LLM verifier when every figure in the specialist reports matched the document
+VERIFY_SKIP_WHEN_CLEAN = os.getenv("VERIFY_SKIP_WHEN_CLEAN", "true").lower() == "true"
+CROSS_CHECK_UNAVAILABLE = "The automatic cross-check could not run for every report; verify the key figures against the fact sheet."
+
+
+def run_stages(task_id: str, bundle, inputs: dict, document):
+    """
+    Run the three specialist stages concurrently and cross-check each report against the
+    document in code as soon as it arrives, storing the verified sections on the job one
+    by one. Once all are in, the report is assembled in code from the reports and their merged
+    check; the LLM verifier only runs to resolve discrepancies in it, when there are any.
+    Each transition is recorded and published as progress.
+
+    Stages run on threads, which are green threads in the eventlet worker: every job may
+    fan out at once, where a per-job asyncio loop would clash with the other jobs' loops
+    on the worker's single OS thread.
+    Returns (final output, {stage: wall-clock seconds}).
+    """
+    timings = {"cross_check": 0.0}
+
+    def run_stage(name, stage_inputs):
+        record_stage(task_id, name, "RUNNING")
+        started = time.perf_counter()
+        try:
+            with timed(STAGE_SECONDS, stage=name):
+                output = bundle.stage_crews[name].kickoff(inputs=stage_inputs)
+        except Exception:
+            record_stage(task_id, name, "FAILURE", time.perf_counter() - started)
+            raise
+        timings[name] = time.perf_counter() - started
+        record_stage(task_id, name, "SUCCESS", timings[name])
+        return output
+
+    finished = queue.Queue()
+
+    def run_specialist(name):
+        try:
+            finished.put((name, str(run_stage(name, inputs)), None))
+        except Exception as e:
+            finished.put((name, None, e))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=run_specialist, args=(name,), daemon=True) for name in SPECIALIST_STAGES]
+    for thread in threads:
+        thread.start()
+
+    # Check each report as it arrives; a failed stage only fails the job once every
+    # specialist has stopped, so no thread still uses the crew when it is returned to the pool
+    sections = {}
+    error = None
+    for _ in SPECIALIST_STAGES:
+        name, report, stage_error = finished.get()
+        if stage_error is not None:
+            error = error or stage_error
+            continue
+        if error is not None:
+            continue
+        if not sections:
+            record_stage(task_id, "cross_check", "RUNNING")
+        check_started = time.perf_counter()
+        try:
+            with timed(STAGE_SECONDS, stage="cross_check"):
+                check = run_cpu(cross_check_job, document.doc_hash, inputs["file_path"], {name: report})
+        except Exception as e:
+            # A failed check falls back to the LLM verifier rather than failing the job
+            print(f"Warning: Cross-check of {name} failed for task {task_id}. Error: {e}")
+            check = None
+        timings["cross_check"] += time.perf_counter() - check_started
+        sections[name] = (report, check)
+        record_partial_result(task_id, format_partial_report(sections, len(SPECIALIST_STAGES)), name)
+    for thread in threads:
+        thread.join()
+    if error is not None:
+        raise error
+    timings["specialists"] = time.perf_counter() - started
+
+    reports = {name: sections[name][0] for name in SPECIALIST_STAGES}
+    checks = [sections[name][1] for name in SPECIALIST_STAGES]
+    check = merge_checks([c for c in checks if c is not None])
+    complete = all(c is not None for c in checks)
+    record_stage(task_id, "cross_check", "SUCCESS" if complete else "FAILURE", timings["cross_check"])
+
+    if complete and not check["mismatches"] and VERIFY_SKIP_WHEN_CLEAN:
+        record_stage(task_id, "verification", "SKIPPED", 0.0)
+        timings["verification"] = 0.0
+        result = format_verified_report(reports, check)
+    else:
+        # The verifier starts from the report already merged and checked here, so it never re-runs the check
+        result = run_stage("verification", {
+            **inputs,
+            "draft_report": format_verified_report(reports, check),
+            "verification_note": "" if complete else CROSS_CHECK_UNAVAILABLE + " ",
+        })
+    timings["total"] = time.perf_counter() - started
+    return result, timings
+
+
+def run_local_stage(task_id: str, name: str, function, *args) -> tuple:
+    """Run one in-process pre-crew stage with progress and timing. Returns (result, seconds)."""
+    record_stage(task_id, name, "RUNNING")
+    started = time.perf_counter()
+    try:
+        with timed(STAGE_SECONDS, stage=name):
+            result = function(*args)
+    except Exception:
+        record_stage(task_id, name, "FAILURE", time.perf_counter() - started)
+        raise
+    elapsed = time.perf_counter() - started
+    record_stage(task_id, name, "SUCCESS", elapsed)
+    return result, elapsed
+
+
+def run_extraction_stage(task_id: str, file_path: str) -> tuple:
+    """
+    Extract and normalize the document up front so every agent's tool call is a cache hit.
+    The pages are streamed into the cache; the worker itself only keeps the document's hash
+    and statistics. Returns (document summary, seconds).
+    """
+    return run_local_stage(task_id, "extraction", cache_document, file_path)
+
+
+def run_fact_sheet_stage(task_id: str, document, file_path: str) -> tuple:
+    """
+    Condense the document once into the fact sheet all four tasks share, so no agent
+    needs the full text in its prompt. Cached by document hash. Returns (sheet, seconds).
+    """
+    return run_local_stage(task_id, "fact_sheet", run_cpu, fact_sheet_job, document.doc_hash, file_path)
+
+
+def build_change_summary(db: Session, document, file_path: str) -> str:
+    """Tell the agents which pages changed since the closest earlier revision of this document."""
+    try:
+        revision = run_cpu(revision_job, document.doc_hash, file_path)
+    except Exception as e:
+        print(f"Warning: Could not compare with earlier revisions. Error: {e}")
+        return NO_REVISION_SUMMARY
+    if revision is None:
+        return NO_REVISION_SUMMARY
+    previous = db.query(models.TaskResult).filter(
+        models.TaskResult.file_hash == revision["doc_hash"],
+        models.TaskResult.status == TaskStatus.SUCCESS,
+    ).order_by(models.TaskResult.completed_at.desc()).first()
+    print(f"Revision of {revision['doc_hash']}: {revision['shared_pages']}/{revision['page_count']} pages unchanged")
+    return format_change_summary(revision, previous.result if previous else None)
+
+
+def report_timings(task_id: str, timings: dict):
+    serial = sum(timings[name] for name in SPECIALIST_STAGES) + timings["verification"]
+    stages = ", ".join(f"{name}={seconds:.1f}s" for name, seconds in timings.items())
+    print(f"Stage timings for {task_id}: {stages} (sum of stages {serial:.1f}s, wall clock {timings['total']:.1f}s)")
+
+
+@celery.task(name=RUN_CREW_TASK, bind=True, max_retries=None)
+def run_crew_task(self, task_id: str, query: str, file_path: str):
     """
     A Celery task to run the CrewAI process in the background.
+    The job only starts once its estimated LLM cost fits the shared budget; until then it is
+    retried on its own queue with a countdown, keeping the uploaded file.
     """
     db: Session = SessionLocal()
+    waiting_for_budget = False
     try:
-        # Define the crew
-        financial_crew = Crew(
-            agents=[financial_analyst, risk_assessor, investment_advisor, verifier],
-            tasks=[financial_analysis, risk_assessment, investment_analysis, verification],
-            process=Process.sequential,
-        )
-
-        # Kick off the crew with the provided inputs
-        result = financial_crew.kickoff({
-            'query': query,
-            'file_path': file_path
-        })
+        if not self.request.retries:
+            # Out of the broker; from here on liveness is judged by stage activity
+            record_stage(task_id, QUEUED_STAGE, "SUCCESS")
+        document, extraction_seconds = run_extraction_stage(task_id, file_path)
+
+        # Admission: extraction is cached, so a retried job only pays for it once
+        tokens, requests = estimate_cost(document.stats["pages"], document.stats["characters"])
+        queue = (self.request.delivery_info or {}).get("routing_key") or INTERACTIVE_QUEUE
+        wait_seconds = llm_budget.try_acquire(tokens, requests, queue)
+        if wait_seconds > 0:
+            waiting_for_budget = True
+            # Shows the wait in the job's progress and keeps retention from taking it for abandoned
+            record_stage(task_id, "admission", "WAITING")
+            countdown = retry_delay(wait_seconds)
+            print(f"LLM budget exhausted for task_id: {task_id} (~{tokens} tokens, {queue}); retrying in {countdown:.0f}s")
+            raise self.retry(countdown=countdown)
+
+        if self.request.retries:
+            record_stage(task_id, "admission", "SUCCESS")
+        fact_sheet, fact_sheet_seconds = run_fact_sheet_stage(task_id, document, file_path)
+        change_summary = build_change_summary(db, document, file_path)
+
+        # Check out an isolated crew for this job; it is reset and returned afterwards
+        with crew_pool.checkout() as bundle:
+            result, timings = run_stages(task_id, bundle, {
+                'query': query,
+                'file_path': file_path,
+                'fact_sheet': fact_sheet,
+                'change_summary': change_summary
+            }, document)
+        timings["extraction"] = extraction_seconds
+        timings["fact_sheet"] = fact_sheet_seconds
+        report_timings(task_id, timings)
 
         # Update the database with the successful result
         db_task = db.query(models.TaskResult).filter(models.TaskResult.task_id == task_id).first()
         if db_task:
-            db_task.status = "SUCCESS"
+            db_task.status = TaskStatus.SUCCESS
             db_task.result = str(result)
-            db.commit()
+            db_task.completed_at = datetime.utcnow()
+            settle_duplicates(db, task_id)
+            with span("db_commit"):
+                db.commit()
+            # Materialize the report and its sections once; the API serves the report from the
+            # database and reads the precomputed sections from these files
+            try:
+                write_result_artifact(task_id, db_task.result)
+            except OSError as e:
+                print(f"Warning: Could not save result to file for task {task_id}. Error: {e}")
             print(f"Database updated successfully for task_id: {task_id}")
+            publish_completion(task_id, "SUCCESS")
         else:
             print(f"Warning: No database task found for task_id: {task_id}")
             
         return str(result)  # Return the result for Celery
 
+    except Retry:
+        raise
     except Exception as e:
         print(f"Error in CrewAI task: {str(e)}")
         # If an error occurs, update the database with the failure status and error message
         db_task = db.query(models.TaskResult).filter(models.TaskResult.task_id == task_id).first()
         if db_task:
-            db_task.status = "FAILURE"
+            db_task.status = TaskStatus.FAILURE
             db_task.result = f"Failed analyzing the document: {str(e)}"
-            db.commit()
+            db_task.completed_at = datetime.utcnow()
+            settle_duplicates(db, task_id)
+            with span("db_commit"):
+                db.commit()
             print(f"Database updated with failure for task_id: {task_id}")
+            publish_completion(task_id, "FAILURE")
         else:
             print(f"Warning: No database task found for task_id: {task_id}")
             
         return f"Error: {str(e)}"  # Return error for Celery
     finally:
-        # Clean up the temporary file
-        if os.path.exists(file_path):
+        # Clean up the temporary file, unless the job will run again
+        if not waiting_for_budget and os.path.exists(file_path):
             try:
                 os.remove(file_path)
                 print(f"Cleaned up file: {file_path}")
             except Exception as e:
                 print(f"Error cleaning up file: {str(e)}")
         db.close()
-        print("Database connection closed")
\ No newline at end of file
+        print("Database connection closed")
+
+
+@celery.task(name=COMBINE_BATCH_REPORTS, bind=True, max_retries=None)
+def combine_batch_reports(self, batch_id: str):
+    """
+    Chord callback for /analyze/batch: merge the per-document reports of a batch
+    into one combined report once every document has finished.
+    The chord only waits for the batch's own runs; documents deduplicated onto a run that
+    is still going are waited for by retrying with a countdown.
+    """
+    db: Session = SessionLocal()
+    try:
+        batch = db.query(models.Batch).filter(models.Batch.batch_id == batch_id).first()
+        if batch is None:
+            print(f"Warning: No batch found for batch_id: {batch_id}")
+            return
+        documents = db.query(models.TaskResult).filter(models.TaskResult.batch_id == batch_id).order_by(models.TaskResult.id).all()
+
+        # Deduplicated documents take their report from the run they were attached to
+        runs = []
+        for document in documents:
+            run = document
+            if document.duplicate_of:
+                run = db.query(models.TaskResult).filter(models.TaskResult.task_id == document.duplicate_of).first() or document
+            runs.append(run)
+        pending = sum(run.status == TaskStatus.PENDING for run in runs)
+        if pending:
+            print(f"Batch {batch_id}: {pending} document(s) still running; combining again in {BATCH_COMBINE_RETRY_SECONDS}s")
+            raise self.retry(countdown=BATCH_COMBINE_RETRY_SECONDS)
+
+        overview = ["| Document | Status |", "|---|---|"]
+        sections = []
+        succeeded = 0
+        for document, run in zip(documents, runs):
+            overview.append(f"| {document.document_name} | {run.status.value} |")
+            if run.status == TaskStatus.SUCCESS:
+                succeeded += 1
+                sections.append(f"## {document.document_name}\n\n{demote_headings(run.result or '')}")
+            else:
+                sections.append(f"## {document.document_name}\n\nAnalysis did not complete: {run.result or run.status.value}")
+
+        combined = "\n\n".join([
+            f"# Combined Analysis of {len(documents)} Documents",
+            f"Query: {batch.query}",
+            "\n".join(overview),
+            *sections,
+        ])
+        batch.combined_result = combined
+        batch.status = TaskStatus.SUCCESS if succeeded else TaskStatus.FAILURE
+        batch.completed_at = datetime.utcnow()
+        db.commit()
+        try:
+            write_result_artifact(f"batch_{batch_id}", combined)
+        except OSError as e:
+            print(f"Warning: Could not save combined report for batch {batch_id}. Error: {e}")
+        print(f"Combined report written for batch_id: {batch_id} ({succeeded}/{len(documents)} succeeded)")
+    finally:
+        db.close()
+
+
+@celery.task(name=COLLECT_GARBAGE)
+def collect_garbage():
+    """Periodic retention pass scheduled by celery beat."""
+    return run_garbage_collection()
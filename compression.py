@@ -0,0 +1,58 @@
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; zlib is always available
+    zstandard = None
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# zstd when installed, else zlib; "none" stores text as plain UTF-8
+RESULT_CODEC = os.getenv("RESULT_CODEC", "zstd" if zstandard is not None else "zlib")
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def compress_text(text: str, codec: str = RESULT_CODEC) -> tuple:
+    """Return (codec, bytes) for a text value; falls back to zlib if zstd is unavailable."""
+    data = text.encode("utf-8")
+    if codec == "zstd" and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == "none":
+        return "none", data
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress_text(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This value is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    return data.decode("utf-8")
+
+
+def compressed_text(blob_attribute: str, codec_attribute: str) -> property:
+    """
+    A str property backed by a compressed LargeBinary column and a codec column,
+    so callers keep reading and assigning plain text.
+    """
+    def getter(self):
+        data = getattr(self, blob_attribute)
+        if data is None:
+            return None
+        return decompress_text(getattr(self, codec_attribute), data)
+
+    def setter(self, text):
+        if text is None:
+            setattr(self, blob_attribute, None)
+            setattr(self, codec_attribute, None)
+            return
+        codec, data = compress_text(text)
+        setattr(self, blob_attribute, data)
+        setattr(self, codec_attribute, codec)
+
+    return property(getter, setter)
@@ -0,0 +1,107 @@
+"""
+Process pool for CPU-bound work in the worker.
+
+The worker runs jobs on eventlet green threads, which suits the I/O-bound LLM waits but
+means any CPU-bound step (PDF parsing, table parsing, fact sheets, cross-checks, search
+indexes) stalls every other job in the process. `run_cpu` sends such steps to a bounded
+process pool instead; the calling green thread waits cooperatively. Pool functions take
+file paths or document hashes and read pages from the shared extraction cache, so only
+small results (strings, dicts) travel back.
+
+Green-thread concurrency is the Celery `-c` setting, LLM concurrency LLM_MAX_CONCURRENCY
+and CPU concurrency CPU_WORKERS, so each kind of work is sized on its own.
+"""
+import os
+import sys
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from metrics import buffer_pages_in_pool_child, drain_pool_child_pages, observe_pages
+
+from dotenv import load_dotenv
+load_dotenv()
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1))))
+# "auto" offloads when the process runs on eventlet green threads; "true"/"false" force it
+CPU_OFFLOAD = os.getenv("CPU_OFFLOAD", "auto").lower()
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_pool_child = False
+
+
+def _mark_pool_child():
+    global _in_pool_child
+    _in_pool_child = True
+    buffer_pages_in_pool_child()
+
+
+def in_pool_child() -> bool:
+    """True inside a pool process, where work runs inline instead of spawning more processes."""
+    return _in_pool_child
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # "spawn" keeps children independent of eventlet's monkey-patched state in the worker
+            _executor = ProcessPoolExecutor(
+                max_workers=CPU_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_mark_pool_child,
+            )
+        return _executor
+
+
+def _eventlet_patched() -> bool:
+    eventlet = sys.modules.get("eventlet")
+    return eventlet is not None and eventlet.patcher.is_monkey_patched("thread")
+
+
+def offload_enabled() -> bool:
+    if _in_pool_child or CPU_WORKERS < 1:
+        return False
+    if CPU_OFFLOAD == "auto":
+        return _eventlet_patched()
+    return CPU_OFFLOAD == "true"
+
+
+def _preload():
+    # Pay for importing the document stack once per pool process, not on the first job
+    import document_jobs  # noqa: F401
+
+
+def warm():
+    """Start the pool processes up front when offloading is on."""
+    if offload_enabled():
+        executor = get_executor()
+        for future in [executor.submit(_preload) for _ in range(CPU_WORKERS)]:
+            future.result()
+
+
+def shutdown():
+    """Stop the pool; without this, interpreter exit can block on it under eventlet."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+
+
+def run_cpu(function, *args):
+    """
+    Run `function(*args)` on the process pool and return its result, or inline when
+    offloading is off. `function` must be a module-level function of a module that
+    does not import the crew stack, so the children stay light.
+    """
+    if not offload_enabled():
+        return function(*args)
+    result, page_timings = get_executor().submit(_run_in_child, function, *args).result()
+    observe_pages(page_timings)
+    return result
+
+
+def _run_in_child(function, *args):
+    """Run a pool job and hand back the page timings it measured along with its result."""
+    return function(*args), drain_pool_child_pages()
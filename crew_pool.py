@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from crewai import Crew, Process
+from agents import build_agents
+from task import build_tasks
+
+from dotenv import load_dotenv
+load_dotenv()
+
+CREW_POOL_SIZE = int(os.getenv("CREW_POOL_SIZE", "4"))
+CREW_CHECKOUT_TIMEOUT = float(os.getenv("CREW_CHECKOUT_TIMEOUT", "600"))
+
+
+class CrewBundle:
+    """One isolated crew: its own agents, tasks, tool instances and per-stage crews."""
+
+    def __init__(self, llm=None):
+        self.agents = build_agents() if llm is None else build_agents(llm)
+        self.tasks = build_tasks(self.agents)
+        # One single-task crew per stage; the worker runs the specialists concurrently itself,
+        # so crewai's own thread-based async execution is turned off here
+        self.stage_crews = {}
+        for name, task in self.tasks.items():
+            task.async_execution = False
+            self.stage_crews[name] = Crew(agents=[task.agent], tasks=[task], process=Process.sequential)
+
+    def reset(self):
+        """Clear everything a previous job left on the tasks and agents."""
+        for task in self.tasks.values():
+            task.output = None
+            task.used_tools = 0
+            task.tools_errors = 0
+            task.delegations = 0
+            task.processed_by_agents = set()
+        for agent in self.agents.values():
+            agent.tools_results = []
+
+
+class CrewPool:
+    """
+    Fixed-size pool of pre-built crews checked out for one job at a time.
+
+    Crews are built lazily up to `size`; once the pool is full, further jobs
+    wait for a crew to be returned. A crew whose job raised is discarded and
+    rebuilt on demand instead of being reused in an unknown state.
+    """
+
+    def __init__(self, size: int = CREW_POOL_SIZE, llm=None):
+        self.size = size
+        self.llm = llm
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def configure(self, size: int = None, llm=None):
+        """Change the pool size or the LLM crews are built with; idle crews are dropped."""
+        with self._lock:
+            if size is not None:
+                self.size = size
+            if llm is not None:
+                self.llm = llm
+            while True:
+                try:
+                    self._idle.get_nowait()
+                    self._created -= 1
+                except queue.Empty:
+                    break
+
+    def _acquire(self, timeout: float) -> CrewBundle:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                build = True
+            else:
+                build = False
+        if build:
+            try:
+                return CrewBundle(self.llm)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No crew became available within {timeout} seconds")
+
+    def _discard(self):
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def checkout(self, timeout: float = CREW_CHECKOUT_TIMEOUT):
+        bundle = self._acquire(timeout)
+        try:
+            yield bundle
+        except Exception:
+            self._discard()
+            raise
+        bundle.reset()
+        self._idle.put(bundle)
+
+    def warm(self):
+        """Build every crew up front so the first jobs skip construction."""
+        bundles = []
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    break
+                self._created += 1
+            bundles.append(CrewBundle(self.llm))
+        for bundle in bundles:
+            self._idle.put(bundle)
+
+
+crew_pool = CrewPool()
@@ -0,0 +1,322 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from financial_tables import PERIOD_PATTERN, UNITS_PATTERN, compute_ratios, extract_statements
+from text_pipeline import NormalizedDocument
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# On top of the rounding implied by a figure's precision, figures within this share still match
+RELATIVE_TOLERANCE = float(os.getenv("CROSS_CHECK_RELATIVE_TOLERANCE", "0.005"))
+MAX_MISMATCH_ROWS = 50
+CONTEXT_CHARS = 50
+MEMORY_INDEXES = 16
+
+_MULTIPLIERS = {
+    "thousand": 1e3, "k": 1e3,
+    "million": 1e6, "m": 1e6, "mm": 1e6, "mn": 1e6,
+    "billion": 1e9, "b": 1e9, "bn": 1e9,
+    "trillion": 1e12,
+}
+_SCALES = {"thousands": 1e3, "millions": 1e6, "billions": 1e9}
+_PERCENT_RATIOS = ("margin", "growth", "return_on")
+# Computed ratios are cited with the page of their numerator
+_RATIO_NUMERATORS = {
+    "gross_margin": "gross_profit", "operating_margin": "operating_income", "net_margin": "net_income",
+    "liabilities_to_equity": "total_liabilities", "debt_to_equity": "total_debt", "current_ratio": "current_assets",
+    "cash_to_current_liabilities": "cash", "return_on_equity": "net_income", "free_cash_flow_margin": "operating_cash_flow",
+}
+
+_FIGURE = re.compile(
+    r"(?<![\w.,])(?P<currency>\$|USD\s?)?(?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)(?![\w,]\d)"
+    r"(?:\s?(?P<unit>%|percent\b|(?i:thousand|million|billion|trillion)s?\b|(?i:bn|mm|mn)\b|[KMB]\b))?"
+)
+# Page references and list or heading numbers are not figures
+_NOT_FIGURES = re.compile(r"\b(?:p\.|pages?\s)\s*\d+(?:\s*[-–]\s*\d+)?|^(?:\s*#+)?\s*\d+[.)]\s", re.I | re.M)
+
+
+def _normalize_period(token: str) -> str:
+    """"Q2 '25", "Q2-2025" and "q2 2025" all become "Q22025"."""
+    normalized = re.sub(r"[\s'’\-,.]", "", token.upper())
+    short = re.fullmatch(r"(Q[1-4]|H[12]|FY)(\d{2})", normalized)
+    return f"{short.group(1)}20{short.group(2)}" if short else normalized
+
+
+_YEAR = re.compile(r"\b(?:19|20)\d{2}\b")
+
+
+def _document_periods(page: str) -> set:
+    """
+    Normalized periods on a page, plus the year of each and every bare year. findall keeps
+    only the longest match, so "Q2 2025" alone would not let a report mention "2025".
+    """
+    periods = {_normalize_period(p) for p in PERIOD_PATTERN.findall(page)}
+    periods.update(p[-4:] for p in list(periods) if _YEAR.fullmatch(p[-4:]))
+    periods.update(_YEAR.findall(page))
+    return periods
+
+
+def _blank(text: str, pattern: re.Pattern) -> str:
+    """Replace matches with spaces so offsets and context stay aligned."""
+    return pattern.sub(lambda m: " " * len(m.group(0)), text)
+
+
+def _figures(text: str):
+    """Yield (value, multiplier or None, is percent, decimals, token, start, end) for each figure."""
+    cleaned = _blank(_blank(text, _NOT_FIGURES), PERIOD_PATTERN)
+    for match in _FIGURE.finditer(cleaned):
+        number = match.group("number")
+        unit = (match.group("unit") or "").lower()
+        percent = unit in ("%", "percent")
+        multiplier = _MULTIPLIERS.get(unit.rstrip("s")) if unit and not percent else None
+        decimals = len(number.split(".")[1]) if "." in number else 0
+        value = float(number.replace(",", ""))
+        yield value, multiplier, percent, decimals, match.group(0).strip(), match.start(), match.end()
+
+
+class FigureIndex:
+    """
+    Every figure of a document as sorted arrays with page numbers: amounts (as printed and
+    scaled by the page's "in millions" style units), percentages, and the line items and
+    ratios computed from its tables. Built once per document.
+    """
+
+    def __init__(self, amounts: np.ndarray, amount_pages: np.ndarray, percents: np.ndarray,
+                 percent_pages: np.ndarray, periods: set):
+        self.amounts = amounts
+        self.amount_pages = amount_pages
+        self.percents = percents
+        self.percent_pages = percent_pages
+        self.periods = periods
+
+    @staticmethod
+    def _sorted(values: list, pages: list) -> tuple:
+        values = np.abs(np.asarray(values, dtype=np.float64))
+        pages = np.asarray(pages, dtype=np.int32)
+        order = np.argsort(values, kind="stable")
+        return values[order], pages[order]
+
+    @classmethod
+    def build(cls, document: NormalizedDocument) -> "FigureIndex":
+        amounts, amount_pages, percents, percent_pages = [], [], [], []
+        periods = set()
+        for page_number, page in enumerate(document.pages, start=1):
+            periods.update(_document_periods(page))
+            units = UNITS_PATTERN.search(page)
+            scale = _SCALES[units.group(1).lower()] if units else None
+            for value, multiplier, percent, _, _, _, _ in _figures(page):
+                if percent:
+                    percents.append(value)
+                    percent_pages.append(page_number)
+                    continue
+                amounts.append(value * multiplier if multiplier else value)
+                amount_pages.append(page_number)
+                if scale and not multiplier:
+                    amounts.append(value * scale)
+                    amount_pages.append(page_number)
+
+        # Computed line items and ratios are what the specialists quote from the analysis tool
+        statements = extract_statements(document)
+        units = next((s.units for s in statements if s.units), None)
+        scale = _SCALES.get(units) if units else None
+        analysis = compute_ratios(statements)
+        for key, values in analysis["items"].items():
+            page = analysis["pages"].get(key, 0)
+            for value in values[np.isfinite(values)]:
+                amounts.append(value)
+                amount_pages.append(page)
+                if scale:
+                    amounts.append(value * scale)
+                    amount_pages.append(page)
+        for key, values in analysis["ratios"].items():
+            numerator = _RATIO_NUMERATORS.get(key, key[:-len("_growth")] if key.endswith("_growth") else key)
+            page = analysis["pages"].get(numerator, 0)
+            percent = any(tag in key for tag in _PERCENT_RATIOS)
+            for value in values[np.isfinite(values)]:
+                (percents if percent else amounts).append(value * 100 if percent else value)
+                (percent_pages if percent else amount_pages).append(page)
+
+        amounts, amount_pages = cls._sorted(amounts, amount_pages)
+        percents, percent_pages = cls._sorted(percents, percent_pages)
+        return cls(amounts, amount_pages, percents, percent_pages, periods)
+
+    @staticmethod
+    def _lookup(values: np.ndarray, pages: np.ndarray, target: float, tolerance: float) -> tuple:
+        """(page of a match or None, closest value, its page); page 0 means a computed figure."""
+        if not len(values):
+            return None, None, None
+        low = np.searchsorted(values, target - tolerance, side="left")
+        high = np.searchsorted(values, target + tolerance, side="right")
+        if high > low:
+            return int(pages[low]), float(values[low]), int(pages[low])
+        nearest = min(max(low, 1), len(values) - 1)
+        if abs(values[nearest - 1] - target) < abs(values[nearest] - target):
+            nearest -= 1
+        return None, float(values[nearest]), int(pages[nearest])
+
+    def match(self, value: float, multiplier, percent: bool, decimals: int) -> tuple:
+        """Match one claimed figure, allowing for its rounding and units."""
+        target = abs(value) * (multiplier or 1)
+        tolerance = max(0.5 * 10 ** -decimals * (multiplier or 1), RELATIVE_TOLERANCE * target)
+        if percent:
+            return self._lookup(self.percents, self.percent_pages, target, tolerance)
+        return self._lookup(self.amounts, self.amount_pages, target, tolerance)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_figure_index(document: NormalizedDocument) -> FigureIndex:
+    key = document.doc_hash
+    if key is not None:
+        with _indexes_lock:
+            if key in _indexes:
+                _indexes.move_to_end(key)
+                return _indexes[key]
+    index = FigureIndex.build(document)
+    if key is not None:
+        with _indexes_lock:
+            _indexes[key] = index
+            while len(_indexes) > MEMORY_INDEXES:
+                _indexes.popitem(last=False)
+    return index
+
+
+def _context(text: str, start: int, end: int) -> str:
+    snippet = text[max(start - CONTEXT_CHARS, 0):end + CONTEXT_CHARS]
+    return " ".join(snippet.split()).replace("|", "/")
+
+
+def _format_figure(value: float, percent: bool) -> str:
+    # Unlike financial_tables.format_value, claims are already in percent and keep their
+    # precision, with magnitude words, so a mismatch message reads like the report
+    if percent:
+        return f"{value:.1f}%"
+    for multiplier, name in ((1e9, "billion"), (1e6, "million")):
+        if value >= multiplier:
+            return f"{value / multiplier:,.2f} {name}"
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+
+def _is_figure_claim(value: float, multiplier, percent: bool, decimals: int, token: str) -> bool:
+    """Small bare integers ("3 specialists", "15 years") are counts, not figures to verify."""
+    return percent or multiplier is not None or decimals > 0 or "$" in token or value >= 100
+
+
+def cross_check(document: NormalizedDocument, reports: dict) -> dict:
+    """
+    Match every figure and period in the specialist reports ({name: text}) against the document.
+    Returns {"checked", "matched", "mismatches": [{report, claim, context, closest, page}]}.
+    """
+    index = get_figure_index(document)
+    checked = matched = 0
+    mismatches = []
+    for name, text in reports.items():
+        text = text or ""
+        for value, multiplier, percent, decimals, token, start, end in _figures(text):
+            if not _is_figure_claim(value, multiplier, percent, decimals, token):
+                continue
+            checked += 1
+            page, closest, closest_page = index.match(value, multiplier, percent, decimals)
+            if page is not None:
+                matched += 1
+                continue
+            mismatches.append({
+                "report": name, "claim": token, "context": _context(text, start, end),
+                "closest": "none" if closest is None else _format_figure(closest, percent),
+                "page": "computed" if closest_page == 0 else closest_page,
+            })
+        for match in PERIOD_PATTERN.finditer(text):
+            checked += 1
+            if _normalize_period(match.group(0)) in index.periods:
+                matched += 1
+                continue
+            mismatches.append({
+                "report": name, "claim": match.group(0), "context": _context(text, match.start(), match.end()),
+                "closest": "period not in document", "page": None,
+            })
+    return {"checked": checked, "matched": matched, "mismatches": mismatches}
+
+
+def format_cross_check(result: dict) -> str:
+    """Summary line plus a markdown table of the figures that did not match the document."""
+    summary = (
+        f"{result['matched']} of {result['checked']} figures and periods in the specialist reports "
+        "match the source document (allowing for units and rounding)."
+    )
+    if not result["mismatches"]:
+        return summary + " No discrepancies found."
+    rows = ["| Report | Claimed | Context | Closest in document | Page |", "|---|---|---|---|---|"]
+    for row in result["mismatches"][:MAX_MISMATCH_ROWS]:
+        page = row["page"] or "-"
+        rows.append(f"| {row['report']} | {row['claim']} | {row['context']} | {row['closest']} | {page} |")
+    if len(result["mismatches"]) > MAX_MISMATCH_ROWS:
+        rows.append(f"\n{len(result['mismatches']) - MAX_MISMATCH_ROWS} more discrepancies not shown.")
+    return f"{summary} {len(result['mismatches'])} did not match:\n\n" + "\n".join(rows)
+
+
+REPORT_TITLES = {
+    "financial_analysis": "Financial Analysis",
+    "risk_assessment": "Risk Assessment",
+    "investment_analysis": "Investment Analysis",
+}
+
+
+def merge_checks(checks: list) -> dict:
+    """Combine per-report cross-check results into one."""
+    return {
+        "checked": sum(check["checked"] for check in checks),
+        "matched": sum(check["matched"] for check in checks),
+        "mismatches": [row for check in checks for row in check["mismatches"]],
+    }
+
+
+# Markdown headings of levels 1-4, which nest two levels deeper inside a combined report
+_NESTABLE_HEADING = re.compile(r"^(#{1,4})(?=\s)", re.M)
+
+
+def demote_headings(text: str) -> str:
+    """Push a report's headings two levels down so it nests under a `##` section heading."""
+    return _NESTABLE_HEADING.sub(r"##\1", text)
+
+
+def _report_section(number: int, name: str, text: str) -> str:
+    body = demote_headings((text or "").strip())
+    return f"## {number}. {REPORT_TITLES.get(name, name)}\n\n{body}"
+
+
+def format_partial_report(sections: dict, total: int) -> str:
+    """
+    The report while specialists are still running: each finished section ({name: (text, check)},
+    in arrival order) with its own cross-check. A check of None means it could not run.
+    """
+    parts = [
+        "# Comprehensive Financial Analysis Report (in progress)",
+        f"*{len(sections)} of {total} specialist sections verified; the final report follows once all have finished*",
+    ]
+    for number, (name, (text, check)) in enumerate(sections.items(), start=1):
+        verdict = format_cross_check(check) if check is not None else "The automatic cross-check could not run."
+        parts.append(f"{_report_section(number, name, text)}\n\n### Cross-check\n\n{verdict}")
+    return "\n\n".join(parts)
+
+
+def format_verified_report(reports: dict, result: dict) -> str:
+    """The final report assembled in code from the specialist reports and the cross-check."""
+    sections = [
+        "# Comprehensive Financial Analysis Report",
+        "*Synthesized from the specialist analyses; every figure cross-checked against the source document*",
+    ]
+    for number, (name, text) in enumerate(reports.items(), start=1):
+        sections.append(_report_section(number, name, text))
+    sections.append(f"## Cross-Verification Results\n\n{format_cross_check(result)}")
+    sections.append(
+        "## Disclaimer\n\nThis analysis is based on the provided financial document and represents the collective "
+        "assessment of multiple AI specialists. All recommendations should be considered in the context of broader "
+        "market conditions and individual investment objectives."
+    )
+    return "\n\n".join(sections)
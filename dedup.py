@@ -0,0 +1,126 @@
+import os
+import hashlib
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+import models
+from models import TaskStatus
+from progress import QUEUED_STAGE, QUEUED_STATUS
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Bump whenever agents, tasks or tools change in a way that changes the report
+PIPELINE_VERSION = "3"
+
+# A PENDING run a worker picked up but that shows no stage activity for this long is assumed
+# dead and is not attached to; runs still queued in the broker are always attached to
+PENDING_ATTACH_TTL = timedelta(seconds=int(os.getenv("DEDUP_PENDING_TTL_SECONDS", "3600")))
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of the user's query."""
+    return " ".join(query.casefold().split())
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def _canonical_runs(file_hash: str, query_key: str, *statuses):
+    return (
+        select(models.TaskResult)
+        .where(
+            models.TaskResult.file_hash == file_hash,
+            models.TaskResult.query_hash == query_key,
+            models.TaskResult.pipeline_version == PIPELINE_VERSION,
+            models.TaskResult.duplicate_of.is_(None),
+            models.TaskResult.status.in_(statuses),
+        )
+        .order_by(models.TaskResult.id.desc())
+    )
+
+
+async def _is_alive(db: AsyncSession, task) -> bool:
+    """
+    A running task is alive while it still waits in the broker for a worker (its `queued`
+    stage is open), or while it was created or recorded a stage within the TTL.
+    """
+    queued = await db.scalar(select(models.TaskStage.id).where(
+        models.TaskStage.task_id == task.task_id,
+        models.TaskStage.stage == QUEUED_STAGE,
+        models.TaskStage.status == QUEUED_STATUS,
+    ))
+    if queued is not None:
+        return True
+    started, finished = (await db.execute(
+        select(func.max(models.TaskStage.started_at), func.max(models.TaskStage.finished_at))
+        .where(models.TaskStage.task_id == task.task_id)
+    )).one()
+    last_seen = max((t for t in (task.created_at, started, finished) if t is not None), default=None)
+    return last_seen is not None and datetime.utcnow() - last_seen < PENDING_ATTACH_TTL
+
+
+async def find_reusable_task(db: AsyncSession, file_hash: str, query_key: str):
+    """
+    Return the newest canonical task for this (file hash, query, pipeline version)
+    that either succeeded or is still running, or None.
+    """
+    candidates = await db.scalars(_canonical_runs(file_hash, query_key, TaskStatus.SUCCESS, TaskStatus.PENDING))
+    for task in candidates:
+        if task.status == TaskStatus.SUCCESS or await _is_alive(db, task):
+            return task
+    return None
+
+
+async def release_dead_runs(db: AsyncSession, file_hash: str, query_key: str) -> int:
+    """
+    Mark running canonical tasks for this key that are no longer alive as failed, so a new
+    run can take the key (see the unique index on running runs). The caller commits.
+    """
+    released = 0
+    for task in (await db.scalars(_canonical_runs(file_hash, query_key, TaskStatus.PENDING))).all():
+        if not await _is_alive(db, task):
+            task.status = TaskStatus.FAILURE
+            task.result = "Job abandoned: superseded by a new submission of the same document and query"
+            task.completed_at = datetime.utcnow()
+            released += 1
+    await db.flush()
+    return released
+
+
+def settle_duplicates(db: Session, task_id: str = None) -> int:
+    """
+    Give PENDING tasks deduplicated onto a finished run that run's final status, either for
+    one run (`task_id`) or for all of them. The report itself stays on the run. The caller commits.
+    """
+    db.flush()
+    run = aliased(models.TaskResult)
+    query = (
+        db.query(models.TaskResult, run)
+        .join(run, run.task_id == models.TaskResult.duplicate_of)
+        .filter(models.TaskResult.status == TaskStatus.PENDING, run.status != TaskStatus.PENDING)
+    )
+    if task_id is not None:
+        query = query.filter(run.task_id == task_id)
+    settled = 0
+    for duplicate, finished in query.all():
+        duplicate.status = finished.status
+        duplicate.completed_at = finished.completed_at
+        settled += 1
+    db.flush()
+    return settled
+
+
+async def get_task(db: AsyncSession, task_id: str):
+    return await db.scalar(select(models.TaskResult).where(models.TaskResult.task_id == task_id))
+
+
+async def resolve_task(db: AsyncSession, db_task):
+    """Follow duplicate_of to the task that actually ran the crew."""
+    if db_task is not None and db_task.duplicate_of:
+        canonical = await get_task(db, db_task.duplicate_of)
+        if canonical is not None:
+            return canonical
+    return db_task
@@ -0,0 +1,217 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# The cache lives on the uploads volume so the app and worker containers share it.
+CACHE_DIRECTORY = Path(os.getenv("EXTRACTION_CACHE_DIR", "/app/data/cache"))
+MEMORY_LIMIT_BYTES = int(os.getenv("EXTRACTION_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+DISK_LIMIT_BYTES = int(os.getenv("EXTRACTION_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Disk entries are JSON Lines: a header with the page count, then one page per line
+DISK_PATTERN = "*.jsonl"
+
+
+def file_sha256(file_path: str) -> str:
+    """Return the hex SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def evict_directory(directory: Path, limit: int, pattern: str = "*"):
+    """Delete least recently used files matching `pattern` until the directory fits in `limit` bytes."""
+    entries = []
+    total = 0
+    for path in Path(directory).glob(pattern):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        try:
+            path.unlink()
+            total -= size
+        except OSError:
+            pass
+
+
+def _pages_size(pages: list) -> int:
+    return sum(len(page) for page in pages)
+
+
+class ExtractionCache:
+    """
+    Two-tier cache of extracted PDF pages keyed by the SHA-256 of the file bytes.
+
+    The memory tier is an LRU bounded by the total size of the cached text.
+    The disk tier stores one JSON Lines file per document, one page per line, so
+    a page range can be streamed without loading the whole document, and evicts
+    the least recently used files once the directory grows past its byte limit.
+    """
+
+    def __init__(self, directory: Path = CACHE_DIRECTORY,
+                 memory_limit: int = MEMORY_LIMIT_BYTES, disk_limit: int = DISK_LIMIT_BYTES):
+        self.directory = Path(directory)
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key: str) -> Path:
+        return self.directory / f"{key}.jsonl"
+
+    def _remember(self, key: str, pages: list):
+        size = _pages_size(pages)
+        if size > self.memory_limit:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_size -= _pages_size(self._memory.pop(key))
+            self._memory[key] = pages
+            self._memory_size += size
+            while self._memory_size > self.memory_limit:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= _pages_size(evicted)
+
+    def get(self, key: str):
+        """Return the cached pages for a document hash, or None on a miss."""
+        with self._lock:
+            pages = self._memory.get(key)
+            if pages is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return pages
+
+        disk_path = self._disk_path(key)
+        try:
+            with open(disk_path, "r", encoding="utf-8") as f:
+                page_count = json.loads(f.readline())["page_count"]
+                pages = [json.loads(line) for line in f]
+            if len(pages) != page_count:
+                raise ValueError("truncated cache entry")
+            os.utime(disk_path)  # Mark as recently used for disk eviction
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(key, pages)
+        return pages
+
+    def put(self, key: str, pages: list):
+        """Store extracted pages in both tiers."""
+        self._remember(key, pages)
+        self.put_stream(key, len(pages), pages)
+
+    def put_stream(self, key: str, page_count: int, pages) -> bool:
+        """
+        Write pages to the disk tier as they arrive from an iterable, so a document never has
+        to be held whole. Returns whether the entry was stored.
+        """
+        tmp_path = None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            disk_path = self._disk_path(key)
+            # Write to a temp file first so a concurrent reader never sees a partial file
+            tmp_path = disk_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"page_count": page_count}) + "\n")
+                for page in pages:
+                    f.write(json.dumps(page) + "\n")
+            os.replace(tmp_path, disk_path)
+            tmp_path = None
+            self._evict_disk()
+            return True
+        except OSError as e:
+            print(f"Warning: Could not write extraction cache entry {key}. Error: {e}")
+            return False
+        finally:
+            # Also drops the partial file when the page iterable itself fails
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
+
+    def iter_pages(self, key: str, start: int = 0, stop: int = None):
+        """
+        Return a generator over the cached pages [start, stop) of a document (0-based),
+        or None on a miss. Disk entries are read line by line, not loaded whole.
+        """
+        with self._lock:
+            pages = self._memory.get(key)
+            if pages is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+        if pages is not None:
+            return iter(pages[start:stop])
+
+        f = None
+        try:
+            f = open(self._disk_path(key), "r", encoding="utf-8")
+            json.loads(f.readline())["page_count"]
+        except (OSError, ValueError, KeyError):
+            if f is not None:
+                f.close()
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+
+        def stream():
+            with f:
+                for index, line in enumerate(f):
+                    if stop is not None and index >= stop:
+                        break
+                    if index >= start:
+                        yield json.loads(line)
+        return stream()
+
+    def page_count(self, key: str):
+        """Number of pages of a cached document, or None if it is not cached."""
+        with self._lock:
+            pages = self._memory.get(key)
+            if pages is not None:
+                return len(pages)
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                return json.loads(f.readline())["page_count"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _evict_disk(self):
+        evict_directory(self.directory, self.disk_limit, DISK_PATTERN)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current memory usage."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+            }
+
+
+extraction_cache = ExtractionCache()
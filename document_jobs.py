@@ -0,0 +1,38 @@
+"""
+CPU-bound document work as module-level functions for the CPU pool (see cpu_pool.py).
+
+Each takes the document's hash and path rather than its text, reads the pages from the
+extraction cache in the pool process and returns only the small result.
+"""
+from cross_check import cross_check
+from fact_sheet import get_fact_sheet
+from financial_tables import analyze_document
+from page_store import find_revision
+from text_pipeline import open_document, resolve_document
+
+
+def fact_sheet_job(doc_hash: str, file_path: str) -> str:
+    return get_fact_sheet(open_document(doc_hash, file_path))
+
+
+def revision_job(doc_hash: str, file_path: str):
+    document = open_document(doc_hash, file_path)
+    return find_revision(document.doc_hash, document.pages)
+
+
+def cross_check_job(doc_hash: str, file_path: str, reports: dict) -> dict:
+    return cross_check(open_document(doc_hash, file_path), reports)
+
+
+def cross_check_text_job(file_path: str, financial_document_data: str, reports: dict) -> dict:
+    return cross_check(resolve_document(file_path, financial_document_data), reports)
+
+
+def document_stats_job(file_path: str, financial_document_data: str) -> dict:
+    return resolve_document(file_path, financial_document_data).stats
+
+
+def financial_analysis_job(file_path: str, financial_document_data: str) -> tuple:
+    """(document stats, rendered line items and ratios)."""
+    document = resolve_document(file_path, financial_document_data)
+    return document.stats, analyze_document(document)
@@ -0,0 +1,137 @@
+import os
+from pypdf import PdfReader
+from page_store import page_heading
+from text_pipeline import iter_document_pages
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Default and upper bound for the text one reader call returns
+READER_MAX_CHARS = int(os.getenv("READER_MAX_CHARS", "12000"))
+TOC_MAX_ENTRIES = 200
+
+
+def _outline_entries(reader: PdfReader, outline, level: int = 0) -> list:
+    entries = []
+    for item in outline:
+        if isinstance(item, list):
+            entries.extend(_outline_entries(reader, item, level + 1))
+            continue
+        try:
+            page_number = reader.get_destination_page_number(item) + 1
+        except Exception:
+            continue
+        entries.append((str(item.title).strip(), page_number, level))
+    return entries
+
+
+def table_of_contents(file_path: str) -> list:
+    """
+    [(title, first page, level)] from the PDF's bookmarks, or, when it has none,
+    from the first line of each page with repeats of the previous heading dropped.
+    """
+    reader = PdfReader(file_path)
+    try:
+        entries = _outline_entries(reader, reader.outline)
+    except Exception:
+        entries = []
+    if entries:
+        return entries[:TOC_MAX_ENTRIES]
+    del reader
+
+    total, pages = iter_document_pages(file_path)
+    previous = None
+    for page_number, text in pages:
+        heading = page_heading(text)
+        if heading and heading != previous:
+            entries.append((heading, page_number, 0))
+            if len(entries) == TOC_MAX_ENTRIES:
+                break
+        previous = heading
+    return entries
+
+
+def format_table_of_contents(entries: list) -> str:
+    if not entries:
+        return "This document has no table of contents or page headings."
+    return "\n".join(f"{'  ' * level}- {title} (p.{page})" for title, page, level in entries)
+
+
+def section_pages(entries: list, section: str):
+    """(first page, last page) of the first entry whose title contains `section`, or None."""
+    wanted = section.strip().lower()
+    for i, (title, first, level) in enumerate(entries):
+        if wanted not in title.lower():
+            continue
+        # The section runs until the next entry at the same or a higher level
+        for next_title, next_first, next_level in entries[i + 1:]:
+            if next_level <= level and next_first > first:
+                return first, next_first - 1
+        return first, None
+    return None
+
+
+def read_document(file_path: str, start_page: int = None, end_page: int = None,
+                  section: str = None, max_chars: int = None, start_offset: int = None) -> str:
+    """
+    Read a page range or named section in bounded pieces. Pages are streamed and the
+    output stops before `max_chars`, ending with where to continue. A page longer than
+    `max_chars` is returned in pieces; `start_offset` is the character of `start_page`
+    the next piece starts at.
+    """
+    max_chars = min(max_chars or READER_MAX_CHARS, READER_MAX_CHARS)
+    offset = max(start_offset or 0, 0)
+    heading = ""
+    if section:
+        entries = table_of_contents(file_path)
+        span = section_pages(entries, section)
+        if span is None:
+            return (
+                f"No section matching '{section}'. Table of contents:\n"
+                f"{format_table_of_contents(entries)}"
+            )
+        # An explicit start page inside the section continues a previous read
+        if (start_page or span[0]) < span[0]:
+            offset = 0
+        start_page = max(start_page or span[0], span[0])
+        end_page = span[1] if end_page is None else end_page
+        heading = f" (section '{section}')"
+
+    first = max(start_page or 1, 1)
+    total, pages = iter_document_pages(file_path, first, end_page)
+    last = total if end_page is None else min(end_page, total)
+    if first > last:
+        return f"No pages in the range {first}-{last}; the document has {total} pages."
+
+    parts = []
+    used = 0
+    next_page = next_offset = None
+    for page_number, text in pages:
+        skip = offset if page_number == first else 0
+        label = f"[page {page_number}, from character {skip}]" if skip else f"[page {page_number}]"
+        body = text.strip()[skip:]
+        block = f"{label}\n{body}"
+        if used + len(block) > max_chars:
+            if not parts:
+                # A page larger than the budget is read in pieces, continuing inside the page
+                room = max(max_chars - len(label) - 1, 1)
+                parts.append(f"{label}\n{body[:room]}")
+                next_page, next_offset = page_number, skip + room
+            else:
+                next_page = page_number
+            break
+        parts.append(block)
+        used += len(block) + 2
+
+    if next_offset is not None:
+        shown_last = next_page
+    else:
+        shown_last = (next_page - 1) if next_page else last
+    lines = [f"Pages {first}-{shown_last} of {total}{heading}.", *parts]
+    if next_offset is not None:
+        lines.append(f"[Stopped inside page {next_page} to stay under {max_chars} characters; "
+                     f"continue with start_page={next_page}, start_offset={next_offset}.]")
+    elif next_page:
+        lines.append(f"[Stopped before page {next_page} to stay under {max_chars} characters; "
+                     f"continue with start_page={next_page}.]")
+    return "\n\n".join(lines)
@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+
+from document_cache import CACHE_DIRECTORY, evict_directory
+from financial_tables import compute_ratios, extract_statements, format_ratio_block, format_value
+from text_pipeline import NormalizedDocument
+
+from dotenv import load_dotenv
+load_dotenv()
+
+FACTS_DIRECTORY = CACHE_DIRECTORY / "facts"
+FACTS_DISK_BYTES = int(os.getenv("FACT_SHEET_DISK_BYTES", str(64 * 1024 * 1024)))
+# Hard cap on the text handed to every task; sections are trimmed from the end
+FACT_SHEET_MAX_CHARS = int(os.getenv("FACT_SHEET_MAX_CHARS", "8000"))
+MEMORY_FACT_SHEETS = 64
+
+# Bump when the sheet layout or the extraction heuristics change
+FACT_SHEET_VERSION = "2"
+
+MAX_SEGMENT_TABLES = 4
+MAX_TABLE_ROWS = 12
+MAX_GUIDANCE = 12
+MAX_RISK_HEADINGS = 25
+GUIDANCE_CHARS = 300
+
+_SEGMENT = re.compile(r"\bsegments?\b|\bby (?:region|geography|product line)\b", re.I)
+_GUIDANCE = re.compile(
+    r"\b(?:guidance|outlook|we (?:expect|anticipate|plan|project|target|aim)|expected to|"
+    r"on track to|for the (?:full )?(?:fiscal )?year|next (?:quarter|year))\b",
+    re.I,
+)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z])")
+_RISK_SECTION = re.compile(r"\brisk factors\b", re.I)
+_RISK_HEADING = re.compile(r"\b(?:adverse(?:ly)?|harm|risks?|uncertaint(?:y|ies)|could|may not|depend(?:s|ent)? on)\b", re.I)
+
+
+def _segment_tables(document: NormalizedDocument, statements: list) -> list:
+    """Parsed tables that sit on a page talking about segments, regions or product lines."""
+    segment_pages = {n for n, page in enumerate(document.pages, start=1) if _SEGMENT.search(page)}
+    blocks = []
+    for statement in statements:
+        if not segment_pages.intersection(statement.pages):
+            continue
+        header = "| Line item | " + " | ".join(statement.periods) + " |\n|---|" + "---|" * len(statement.periods)
+        rows = [
+            f"| {label} (p.{page}) | " + " | ".join(format_value(v, False) for v in values) + " |"
+            for label, page, values in list(zip(statement.line_items, statement.pages, statement.values))[:MAX_TABLE_ROWS]
+        ]
+        units = f" (in {statement.units})" if statement.units else ""
+        blocks.append(f"Table on p.{statement.pages[0]}{units}\n{header}\n" + "\n".join(rows))
+        if len(blocks) == MAX_SEGMENT_TABLES:
+            break
+    return blocks
+
+
+def _prose_blocks(page: str) -> list:
+    """Join wrapped prose lines; short lines without a full stop (headings, table rows) end a block."""
+    blocks, current = [], []
+    for line in page.split("\n"):
+        if len(line.split()) < 6 and "." not in line:
+            if current:
+                blocks.append(" ".join(current))
+                current = []
+            continue
+        current.append(line.strip())
+    if current:
+        blocks.append(" ".join(current))
+    return blocks
+
+
+def _guidance(document: NormalizedDocument) -> list:
+    """Forward-looking sentences (outlook, expectations, targets) with their page."""
+    found = []
+    seen = set()
+    for page_number, page in enumerate(document.pages, start=1):
+        sentences = (s for block in _prose_blocks(page) for s in _SENTENCE_END.split(block))
+        for sentence in sentences:
+            sentence = sentence.strip()
+            if len(sentence) < 30 or not _GUIDANCE.search(sentence):
+                continue
+            # Safe-harbor boilerplate repeats the trigger words without saying anything
+            if "forward-looking statements" in sentence.lower():
+                continue
+            key = sentence.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            if len(sentence) > GUIDANCE_CHARS:
+                sentence = sentence[:GUIDANCE_CHARS].rsplit(" ", 1)[0] + " ..."
+            found.append(f"- (p.{page_number}) {sentence}")
+            if len(found) == MAX_GUIDANCE:
+                return found
+    return found
+
+
+def _risk_headings(document: NormalizedDocument) -> list:
+    """Short risk-like lines from the "Risk Factors" section onwards, which are usually its headings."""
+    headings = []
+    seen = set()
+    in_section = False
+    for page_number, page in enumerate(document.pages, start=1):
+        for line in page.split("\n"):
+            line = line.strip()
+            if not in_section:
+                in_section = bool(_RISK_SECTION.search(line)) and len(line) < 80
+                continue
+            if not 25 <= len(line) <= 200 or not line[0].isupper() or line.endswith((",", ";")):
+                continue
+            if not _RISK_HEADING.search(line) or line.lower() in seen:
+                continue
+            seen.add(line.lower())
+            headings.append(f"- (p.{page_number}) {line}")
+            if len(headings) == MAX_RISK_HEADINGS:
+                return headings
+    return headings
+
+
+def build_fact_sheet(document: NormalizedDocument) -> str:
+    """
+    Condense a document into the figures and headings every agent needs:
+    key figures and ratios, segment tables, guidance and risk-factor headings,
+    each with page references. Built deterministically, without the LLM.
+    """
+    statements = extract_statements(document)
+    units = next((s.units for s in statements if s.units), None)
+    sections = [
+        f"Fact sheet ({document.stats['pages']} pages). Page references are to the original document.",
+        "## Key figures\n" + format_ratio_block(compute_ratios(statements), units),
+    ]
+    segments = _segment_tables(document, statements)
+    if segments:
+        sections.append("## Segment tables\n" + "\n\n".join(segments))
+    guidance = _guidance(document)
+    sections.append("## Guidance and outlook\n" + ("\n".join(guidance) if guidance else "No explicit guidance found."))
+    risks = _risk_headings(document)
+    sections.append("## Risk-factor headings\n" + ("\n".join(risks) if risks else "No risk factors section found."))
+
+    sheet = "\n\n".join(sections)
+    if len(sheet) > FACT_SHEET_MAX_CHARS:
+        sheet = sheet[:FACT_SHEET_MAX_CHARS].rsplit("\n", 1)[0] + "\n[fact sheet truncated; search the document for more]"
+    return sheet
+
+
+def _disk_path(key: str):
+    return FACTS_DIRECTORY / f"{key}.json"
+
+
+_sheets = OrderedDict()
+_sheets_lock = threading.Lock()
+
+
+def get_fact_sheet(document: NormalizedDocument) -> str:
+    """Return the document's fact sheet from memory or disk, building and persisting it once."""
+    if document.doc_hash is None:
+        return build_fact_sheet(document)
+    key = f"{document.doc_hash}-v{FACT_SHEET_VERSION}"
+    with _sheets_lock:
+        if key in _sheets:
+            _sheets.move_to_end(key)
+            return _sheets[key]
+
+    sheet = None
+    try:
+        with open(_disk_path(key), "r", encoding="utf-8") as f:
+            sheet = json.load(f)["fact_sheet"]
+        os.utime(_disk_path(key))
+    except (OSError, ValueError, KeyError):
+        pass
+    if sheet is None:
+        sheet = build_fact_sheet(document)
+        try:
+            FACTS_DIRECTORY.mkdir(parents=True, exist_ok=True)
+            tmp_path = _disk_path(key).with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"doc_hash": document.doc_hash, "fact_sheet": sheet}, f)
+            os.replace(tmp_path, _disk_path(key))
+            evict_directory(FACTS_DIRECTORY, FACTS_DISK_BYTES, "*.json")
+        except OSError as e:
+            print(f"Warning: Could not persist fact sheet {document.doc_hash}. Error: {e}")
+
+    with _sheets_lock:
+        _sheets[key] = sheet
+        while len(_sheets) > MEMORY_FACT_SHEETS:
+            _sheets.popitem(last=False)
+    return sheet
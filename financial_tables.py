@@ -0,0 +1,278 @@
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from text_pipeline import NormalizedDocument
+
+# Column headers such as "Q2-2025", "Q2 '25", "FY2024", "2024" or "June 30, 2025"
+PERIOD_PATTERN = re.compile(
+    r"\b(?:Q[1-4][-\s]?'?(?:19|20)?\d{2}|FY\s?'?(?:19|20)?\d{2}|H[12][-\s]?(?:19|20)\d{2}"
+    r"|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2},\s+(?:19|20)\d{2}"
+    r"|(?:19|20)\d{2})\b"
+)
+_NUMBER = re.compile(r"^\(?-?\$?\(?\d[\d,]*(?:\.\d+)?\)?%?$")
+_MISSING = {"-", "—", "–", "n/a", "N/A", "NM", "nm"}
+
+_STATEMENT_HEADINGS = (
+    ("income_statement", re.compile(r"income statements?|statements? of (?:operations|income)|profit and loss", re.I)),
+    ("balance_sheet", re.compile(r"balance sheets?|statements? of financial position", re.I)),
+    ("cash_flow", re.compile(r"cash flows?(?: statements?)?", re.I)),
+)
+UNITS_PATTERN = re.compile(r"\(?in (thousands|millions|billions)\b", re.I)
+
+# Canonical line items and the label patterns that identify them, most specific first
+LINE_ITEMS = {
+    "revenue": (r"^total revenues?$", r"^(?:net |total net )?revenues?$", r"^net sales$", r"^total net sales$"),
+    "gross_profit": (r"^total gross profit$", r"^gross profit$"),
+    "operating_income": (r"^income \(loss\) from operations$", r"^income from operations$", r"^operating income$"),
+    "net_income": (r"^net income attributable to common", r"^net income \(loss\)", r"^net income$"),
+    "total_assets": (r"^total assets$",),
+    "total_liabilities": (r"^total liabilities$",),
+    "total_equity": (r"^total (?:stockholders|shareholders)['’]? equity$", r"^total equity$"),
+    "current_assets": (r"^total current assets$",),
+    "current_liabilities": (r"^total current liabilities$",),
+    "cash": (r"^cash and cash equivalents$", r"^total cash and (?:cash equivalents and )?investments$"),
+    "total_debt": (r"^total debt", r"^long-term debt"),
+    "operating_cash_flow": (r"^net cash provided by (?:\(used in\) )?operating activities$", r"^operating cash flows?$"),
+    "capital_expenditures": (r"^capital expenditures$", r"^purchases of property and equipment"),
+}
+_LINE_ITEM_PATTERNS = {key: [re.compile(p, re.I) for p in patterns] for key, patterns in LINE_ITEMS.items()}
+
+
+def parse_number(token: str) -> float:
+    """Parse "1,234", "(1,234)", "$(1,234)", "$5.2" or "12%" into a float; parentheses mean negative."""
+    cleaned = token.replace("$", "").replace(",", "")
+    negative = cleaned.startswith("(") or cleaned.startswith("-")
+    value = float(cleaned.strip("()%-"))
+    return -value if negative else value
+
+
+def _split_row(line: str):
+    """Split a table row into (label, [numeric tokens]); numbers are taken from the right."""
+    tokens = line.split()
+    values = []
+    while tokens:
+        # Filings often print the currency symbol as its own column: "Total revenues $ 97,690 $ 96,773"
+        if tokens[-1] == "$":
+            tokens.pop()
+        elif _NUMBER.match(tokens[-1]) or tokens[-1] in _MISSING:
+            values.append(tokens.pop())
+        else:
+            break
+    values.reverse()
+    return " ".join(tokens).strip(" :."), values
+
+
+class FinancialStatement:
+    """One parsed table: line items as rows, periods as columns."""
+
+    def __init__(self, name: str, periods: list, units: str = None):
+        self.name = name
+        self.periods = periods
+        self.units = units
+        self.line_items = []
+        self.pages = []
+        self._rows = []
+
+    def add_row(self, label: str, values: list, page_number: int):
+        if label in self.line_items:
+            return
+        row = np.full(len(self.periods), np.nan)
+        for i, token in enumerate(values[:len(self.periods)]):
+            if token not in _MISSING and not token.endswith("%"):
+                row[i] = parse_number(token)
+        self.line_items.append(label)
+        self.pages.append(page_number)
+        self._rows.append(row)
+
+    @property
+    def values(self) -> np.ndarray:
+        if not self._rows:
+            return np.empty((0, len(self.periods)))
+        return np.vstack(self._rows)
+
+
+def extract_statements(document: NormalizedDocument) -> list:
+    """Find period header rows and collect the numeric rows that follow them into statements."""
+    statements = []
+    for page_number, page in enumerate(document.pages, start=1):
+        units_match = UNITS_PATTERN.search(page)
+        units = units_match.group(1).lower() if units_match else None
+        section = "financial_summary"
+        current = None
+        for line in page.split("\n"):
+            periods = PERIOD_PATTERN.findall(line)
+            remainder = PERIOD_PATTERN.sub("", line)
+            if len(periods) >= 2 and len(remainder) <= 80 and not re.search(r"\d", remainder):
+                current = FinancialStatement(section, [p.strip() for p in periods], units)
+                statements.append(current)
+                continue
+            label, values = _split_row(line)
+            if not values:
+                # A short line without numbers may open a new statement
+                for name, pattern in _STATEMENT_HEADINGS:
+                    if pattern.search(line) and len(line) < 80:
+                        section = name
+                        current = None
+                continue
+            if current is not None and label and len(values) >= len(current.periods) and re.search(r"[A-Za-z]", label):
+                current.add_row(label, values, page_number)
+    return [s for s in statements if s.line_items]
+
+
+def find_line_item(statements: list, key: str):
+    """Return (values array, periods, page) for a canonical line item, or None."""
+    for pattern in _LINE_ITEM_PATTERNS[key]:
+        for statement in statements:
+            for row, label in enumerate(statement.line_items):
+                if pattern.search(label):
+                    return statement.values[row], statement.periods, statement.pages[row]
+    return None
+
+
+_MONTHS = {m: i for i, m in enumerate(("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)}
+
+
+def _period_end(period: str):
+    """Sortable (year, month) for the end of a period label, or None when it cannot be dated."""
+    year = re.search(r"((?:19|20)\d{2})\b|'(\d{2})\b|(?<=\D)(\d{2})$", period)
+    if year is None:
+        return None
+    year = int(year.group(1)) if year.group(1) else 2000 + int(year.group(2) or year.group(3))
+    quarter = re.match(r"([QH])([1-4])", period, re.I)
+    if quarter:
+        return year, int(quarter.group(2)) * (3 if quarter.group(1).upper() == "Q" else 6)
+    month = re.match(r"([A-Za-z]{3})[a-z]*\.?\s+(\d{1,2}),", period)
+    if month and month.group(1).lower() in _MONTHS:
+        return year, _MONTHS[month.group(1).lower()] + int(month.group(2)) / 100
+    return year, 12
+
+
+def chronological_order(periods: list):
+    """
+    Column indices from oldest to newest period. Filings usually print the newest period
+    first, so the printed order cannot be trusted. None when the labels cannot be dated or
+    repeat (e.g. three- and six-month columns side by side).
+    """
+    ends = [_period_end(period) for period in periods]
+    if None in ends or len(set(ends)) != len(ends):
+        return None
+    return np.array(sorted(range(len(periods)), key=lambda i: ends[i]))
+
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = numerator / denominator
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+
+def compute_ratios(statements: list) -> dict:
+    """
+    Compute margins, growth, leverage and liquidity ratios for every period at once.
+    Periods missing from an item's own table are NaN and propagate as n/a.
+    """
+    found = {key: find_line_item(statements, key) for key in LINE_ITEMS}
+    found = {key: item for key, item in found.items() if item is not None}
+    if not found:
+        return {"periods": [], "items": {}, "ratios": {}, "pages": {}}
+
+    # Align every item onto the revenue (or first found) period axis by period label
+    anchor = found.get("revenue") or next(iter(found.values()))
+    periods = anchor[1]
+    items = {}
+    for key, (values, item_periods, _) in found.items():
+        column = {period: i for i, period in enumerate(item_periods)}
+        positions = np.array([column.get(period, -1) for period in periods])
+        if (positions >= 0).any():
+            aligned = np.full(len(periods), np.nan)
+            aligned[positions >= 0] = values[positions[positions >= 0]]
+            items[key] = aligned
+    pages = {key: found[key][2] for key in items}
+
+    ratios = {}
+
+    def ratio(name, numerator, denominator):
+        if numerator in items and denominator in items:
+            ratios[name] = _safe_divide(items[numerator], items[denominator])
+
+    ratio("gross_margin", "gross_profit", "revenue")
+    ratio("operating_margin", "operating_income", "revenue")
+    ratio("net_margin", "net_income", "revenue")
+    ratio("liabilities_to_equity", "total_liabilities", "total_equity")
+    ratio("debt_to_equity", "total_debt", "total_equity")
+    ratio("current_ratio", "current_assets", "current_liabilities")
+    ratio("cash_to_current_liabilities", "cash", "current_liabilities")
+    ratio("return_on_equity", "net_income", "total_equity")
+
+    if "operating_cash_flow" in items and "capital_expenditures" in items:
+        items["free_cash_flow"] = items["operating_cash_flow"] - np.abs(items["capital_expenditures"])
+        ratio("free_cash_flow_margin", "free_cash_flow", "revenue")
+
+    # Growth over the previous period in time, reported under the later period
+    order = chronological_order(periods) if len(periods) > 1 else None
+    for key in ("revenue", "operating_income", "net_income", "free_cash_flow"):
+        if key in items and order is not None:
+            chronological = items[key][order]
+            growth = np.full(len(periods), np.nan)
+            growth[order[1:]] = _safe_divide(np.diff(chronological), np.abs(chronological[:-1]))
+            ratios[f"{key}_growth"] = growth
+
+    return {"periods": periods, "items": items, "ratios": ratios, "pages": pages}
+
+
+def format_value(value: float, percent: bool) -> str:
+    """Table cell for a line item or ratio; `percent` values are fractions (0.18 -> 18.0%)."""
+    if np.isnan(value):
+        return "n/a"
+    if percent:
+        return f"{value * 100:.1f}%"
+    return f"{value:,.2f}" if abs(value) < 100 else f"{value:,.0f}"
+
+
+_PERCENT_RATIOS = ("margin", "growth", "return_on")
+
+
+def format_ratio_block(analysis: dict, units: str = None) -> str:
+    """Render items and ratios as compact markdown tables, one column per period."""
+    periods = analysis["periods"]
+    if not periods:
+        return "No structured financial tables could be parsed from this document."
+    header = "| Metric | " + " | ".join(periods) + " |\n|---|" + "---|" * len(periods)
+    lines = [f"### Line items{f' (in {units})' if units else ''}", header]
+    for key, values in analysis["items"].items():
+        page = analysis["pages"].get(key)
+        label = f"{key} (p.{page})" if page else key
+        lines.append(f"| {label} | " + " | ".join(format_value(v, False) for v in values) + " |")
+    lines += ["", "### Ratios", header]
+    for key, values in analysis["ratios"].items():
+        percent = any(tag in key for tag in _PERCENT_RATIOS)
+        lines.append(f"| {key} | " + " | ".join(format_value(v, percent) for v in values) + " |")
+    return "\n".join(lines)
+
+
+_analyses = OrderedDict()
+_analyses_lock = threading.Lock()
+MEMORY_ANALYSES = 32
+
+
+def analyze_document(document: NormalizedDocument) -> str:
+    """Parse statements and render the ratio block, memoized per document hash."""
+    key = document.doc_hash
+    if key is not None:
+        with _analyses_lock:
+            if key in _analyses:
+                _analyses.move_to_end(key)
+                return _analyses[key]
+
+    statements = extract_statements(document)
+    units = next((s.units for s in statements if s.units), None)
+    block = format_ratio_block(compute_ratios(statements), units)
+
+    if key is not None:
+        with _analyses_lock:
+            _analyses[key] = block
+            while len(_analyses) > MEMORY_ANALYSES:
+                _analyses.popitem(last=False)
+    return block
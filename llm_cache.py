@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import closing, contextmanager
+from pathlib import Path
+from crewai import LLM
+from llm_limits import llm_slot
+from metrics import LLM_CALL_SECONDS, install_llm_usage_callback, timed
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# off: no caching, read_write: serve hits and record misses, replay: serve hits and fail on a miss
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "read_write")
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", "/app/data/cache/llm_responses.sqlite3"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+install_llm_usage_callback()
+
+# Parameters that change what the model returns and therefore belong in the key
+_KEY_PARAMETERS = (
+    "model", "temperature", "max_tokens", "max_completion_tokens", "top_p", "n", "stop",
+    "frequency_penalty", "presence_penalty", "seed", "response_format", "reasoning_effort",
+)
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in replay mode when no recorded response exists for a request."""
+
+
+class LLMResponseStore:
+    """SQLite-backed response store with TTL expiry and size-based LRU eviction."""
+
+    def __init__(self, path: Path = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.execute(
+                            "CREATE TABLE IF NOT EXISTS responses ("
+                            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+                            "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+                        )
+                        conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used)")
+                    self._initialized = True
+        # One short-lived connection per call keeps this safe across threads and green threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    @contextmanager
+    def _transaction(self):
+        with closing(self._connect()) as conn:
+            with conn:
+                yield conn
+
+    def get(self, key: str):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            return response
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            if self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # Drop least recently used rows until the store fits again
+                for old_key, old_size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    total -= old_size
+
+
+class CachedLLM(LLM):
+    """
+    LLM that answers repeated requests from a persistent response store.
+
+    The cache key covers the model, every sampling parameter and the exact
+    message list (plus tool schemas), so any change to the prompt is a miss.
+    """
+
+    def __init__(self, *args, cache_mode: str = LLM_CACHE_MODE, store: LLMResponseStore = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_mode = cache_mode
+        self.store = store or LLMResponseStore()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def cache_key(self, messages, tools=None) -> str:
+        payload = {name: getattr(self, name, None) for name in _KEY_PARAMETERS}
+        payload["messages"] = messages
+        payload["tools"] = tools
+        encoded = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        if self.cache_mode == "off":
+            return self._call_api(messages, tools, callbacks, available_functions, **kwargs)
+
+        started = time.perf_counter()
+        key = self.cache_key(messages, tools)
+        cached = self.store.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            LLM_CALL_SECONDS.labels(model=self.model, source="cache", outcome="ok").observe(time.perf_counter() - started)
+            return cached
+
+        self.cache_misses += 1
+        if self.cache_mode == "replay":
+            raise LLMCacheMiss(f"No recorded response for {self.model} request {key} in replay mode")
+
+        response = self._call_api(messages, tools, callbacks, available_functions, **kwargs)
+        # Only plain text answers are replayable; tool-call objects are not cached
+        if isinstance(response, str):
+            self.store.put(key, response)
+        return response
+
+    def _call_api(self, messages, tools, callbacks, available_functions, **kwargs):
+        # Only real requests take a concurrency slot; cache hits never wait
+        with llm_slot():
+            with timed(LLM_CALL_SECONDS, model=self.model, source="api"):
+                return super().call(messages, tools, callbacks, available_functions, **kwargs)
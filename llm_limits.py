@@ -0,0 +1,18 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Upper bound on Gemini requests in flight from this process, across all jobs and stages
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+
+@contextmanager
+def llm_slot():
+    """Hold one of the process-wide LLM request slots for the duration of a call."""
+    with _llm_slots:
+        yield
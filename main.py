@@ -1,74 +1,153 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, BackgroundTasks, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import os
 import uuid
 from pathlib import Path
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 import asyncio
-from crewai import Crew, Process
-from agents import financial_analyst, risk_assessor, investment_advisor, verifier
-from task import (
-    financial_analysis, 
-    risk_assessment, 
-    investment_analysis, 
-    verification
-)
 
-#Import Celery task and db components
-from celery_tasks import run_crew_task
+#Import the enqueue interface and db components; the crew stack only loads in the worker
+from celery import chord, group
+from celery_app import analysis_signature, combine_signature, enqueue_analysis
 import models
-from database import SessionLocal, engine
+from database import AsyncSessionLocal, engine
+from models import TaskStatus
+from uploads import (
+    save_upload,
+    extract_zip_pdfs,
+    MAX_UPLOAD_BYTES,
+    MAX_BATCH_UPLOAD_BYTES,
+    MAX_BATCH_DOCUMENTS,
+    UPLOAD_DIRECTORY,
+    ZIP_MAGIC
+)
+from dedup import PIPELINE_VERSION, find_reusable_task, get_task, query_hash, release_dead_runs, resolve_task
+from result_store import cached_json_response, etag_for, load_sections
+from progress import QUEUED_STAGE, QUEUED_STATUS, load_stages, progress_events, subscribe
+from metrics import render_latest, span
+from scheduler import BULK_QUEUE, choose_queue, count_pages
+from schema import upgrade_schema
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Create database tables and upgrade ones left by earlier versions
+upgrade_schema(engine)
 
 app = FastAPI(title="Financial Document Analyzer")
 
-UPLOAD_DIRECTORY = Path("/app/data")
+# Multipart overhead allowance on top of the file size limit
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse oversized uploads from the Content-Length header before the body is parsed."""
+    if request.method == "POST" and request.url.path.startswith("/analyze"):
+        limit = MAX_BATCH_UPLOAD_BYTES if request.url.path.startswith("/analyze/batch") else MAX_UPLOAD_BYTES
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit + UPLOAD_FORM_OVERHEAD_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Upload exceeds the {limit} byte limit"}
+            )
+    return await call_next(request)
+
 UPLOAD_DIRECTORY.mkdir(parents=True, exist_ok=True)
 
-# Dependency to get the database session
-def get_db():
-    db = SessionLocal()
-    try:
+# Dependency to get an async database session, so handlers never block the event loop
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
-def run_crew(query: str, file_path: str="data/TSLA-Q2-2025-Update.pdf"):
-    """To run the whole crew"""
-    financial_crew = Crew(
-        agents=[
-            financial_analyst, 
-            risk_assessor, 
-            investment_advisor, 
-            verifier
-        ],
-        tasks=[
-            financial_analysis, 
-            risk_assessment, 
-            investment_analysis, 
-            verification
-        ],
-        process=Process.sequential,
+
+def _new_upload_path() -> Path:
+    return UPLOAD_DIRECTORY / f"financial_document_{uuid.uuid4()}.pdf"
+
+
+async def _register_document(db: AsyncSession, file_path_obj: Path, file_hash: str, query: str,
+                             batch_id: str = None, document_name: str = None):
+    """
+    Add the task row for a saved upload, reusing a finished or running analysis of the
+    same document and query when there is one. The caller commits.
+    Returns (new task, existing task it was deduplicated onto or None).
+    """
+    query_key = query_hash(query)
+    task_id = str(uuid.uuid4())
+    for attempt in range(2):
+        existing_task = await find_reusable_task(db, file_hash, query_key)
+        if existing_task:
+            break
+        db_task = models.TaskResult(
+            task_id=task_id,
+            status=TaskStatus.PENDING,
+            file_path=str(file_path_obj),
+            file_hash=file_hash,
+            query_hash=query_key,
+            pipeline_version=PIPELINE_VERSION,
+            batch_id=batch_id,
+            document_name=document_name
+        )
+        try:
+            # Flushed in a savepoint so a later identical document in the same batch attaches to this one
+            async with db.begin_nested():
+                db.add(db_task)
+                # Open until a worker picks the run up, so a long broker wait never reads as a dead run
+                db.add(models.TaskStage(task_id=task_id, stage=QUEUED_STAGE, status=QUEUED_STATUS))
+        except IntegrityError:
+            # The key is held by an identical upload that registered first (attach to it on the
+            # next lookup) or by a run that died; only one running run per key is allowed
+            if attempt:
+                raise
+            await release_dead_runs(db, file_hash, query_key)
+            continue
+        print(f"Database task created with ID: {task_id}")
+        return db_task, None
+
+    db_task = models.TaskResult(
+        task_id=task_id,
+        status=existing_task.status,
+        file_path=existing_task.file_path,
+        file_hash=file_hash,
+        query_hash=query_key,
+        pipeline_version=PIPELINE_VERSION,
+        duplicate_of=existing_task.task_id,
+        batch_id=batch_id,
+        document_name=document_name
     )
-    
-    result = financial_crew.kickoff({
-        'query': query,
-        'file_path': file_path
-    })
-    return result
+    db.add(db_task)
+    # The canonical run owns its own copy of the document
+    await asyncio.to_thread(os.remove, file_path_obj)
+    print(f"Task {task_id} deduplicated onto {existing_task.task_id} ({existing_task.status})")
+    return db_task, existing_task
+
+
+async def _fail_unqueued(db: AsyncSession, tasks: list, error: Exception):
+    """Fail runs that never reached the broker, so their open `queued` stage does not hold the dedup key."""
+    for task in tasks:
+        task.status = TaskStatus.FAILURE
+        task.result = f"Job could not be queued: {error}"
+        task.completed_at = datetime.utcnow()
+    await db.commit()
+
 
 @app.get("/")
 async def root():
     return {"message": "Financial Document Analyzer API is running"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint for the API process."""
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+
 @app.post("/analyze", status_code=202)
 async def analyze_financial_doc(
     file: UploadFile = File(...),
     query: str = Form(default="Analyze this financial document for investment insights"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         file_id = str(uuid.uuid4())
@@ -78,73 +157,261 @@ async def analyze_financial_doc(
         
         print(f"Generated file path: {file_path_str}")
     
-        # Ensure data directory exists
-        os.makedirs("data", exist_ok=True)
-        
-        # Save uploaded file
-        with open(file_path_obj, "wb") as f:
-            content = await file.read()
-            f.write(content)
-            print(f"File saved successfully. Size: {len(content)} bytes")
+        # 1. Stream the upload to disk, hashing and validating it on the way
+        with span("upload_write"):
+            file_hash, file_size = await save_upload(file, file_path_obj)
+        print(f"File saved successfully. Size: {file_size} bytes, sha256: {file_hash}")
             
-        # 2. Create a task entry in the database
-        task_id = str(uuid.uuid4())
-        db_task = models.TaskResult(
-            task_id=task_id,
-            status="PENDING",
-            file_path=file_path_str
-        )
-        db.add(db_task)
-        db.commit()
-        db.refresh(db_task)
-        print(f"Database task created with ID: {task_id}")
-        
-        # 3. Send the task to the Celery worker
-        print("Sending task to Celery worker...")
-        run_crew_task.delay(task_id, query.strip(), file_path_str)
+        # 2. Reuse a finished or running analysis of the same document and query
+        db_task, existing_task = await _register_document(db, file_path_obj, file_hash, query)
+        with span("db_commit"):
+            await db.commit()
+
+        if existing_task:
+            if existing_task.status == TaskStatus.SUCCESS:
+                return JSONResponse(
+                    status_code=200,
+                    content={"status": "SUCCESS", "task_id": db_task.task_id, "result": existing_task.result}
+                )
+            return {"message": "An identical analysis is already running; this task is attached to it.", "task_id": db_task.task_id}
+
+        # 3. Send the task to the Celery worker; short documents take the interactive queue
+        queue = choose_queue(await asyncio.to_thread(count_pages, file_path_obj))
+        print(f"Sending task to Celery worker on the {queue} queue...")
+        with span("enqueue"):
+            try:
+                enqueue_analysis(db_task.task_id, query.strip(), file_path_str, queue)
+            except Exception as e:
+                await _fail_unqueued(db, [db_task], e)
+                raise
         print("Task sent to Celery worker successfully")
 
-        return {"message": "Analysis has been queued.", "task_id": task_id}
+        return {"message": "Analysis has been queued.", "task_id": db_task.task_id, "queue": queue}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing financial document: {str(e)}")
 
 
+async def _load_finished_task(task_id: str, db: AsyncSession):
+    """Look up a task (following deduplication) and return it, or a response for non-success states."""
+    db_task = await get_task(db, task_id)
+
+    if not db_task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    # Deduplicated tasks report the state of the run they are attached to
+    db_task = await resolve_task(db, db_task)
+
+    if db_task.status == TaskStatus.PENDING:
+        pending = {
+            "status": "PENDING",
+            "message": "Analysis is still in progress. Please check back later.",
+            "stages": await load_stages(db, db_task.task_id)
+        }
+        # Specialist sections are verified and stored one by one as they finish
+        if db_task.result is not None:
+            pending["partial_result"] = db_task.result
+        return None, pending
+
+    if db_task.status == TaskStatus.FAILURE:
+        return None, JSONResponse(
+            status_code=500,
+            content={"status": "FAILURE", "result": db_task.result}
+        )
+
+    return db_task, None
+
+
 @app.get("/results/{task_id}")
-async def get_analysis_result(task_id: str, db: Session = Depends(get_db)):
+async def get_analysis_result(task_id: str, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Fetches the result of an analysis task.
+    Successful results carry ETag/Last-Modified, honour conditional requests and are compressed on request.
     """
-    db_task = db.query(models.TaskResult).filter(models.TaskResult.task_id == task_id).first()
+    db_task, early_response = await _load_finished_task(task_id, db)
+    if early_response is not None:
+        return early_response
+
+    return cached_json_response(
+        request,
+        {"status": "SUCCESS", "result": db_task.result},
+        etag_for(db_task.result),
+        db_task.completed_at or db_task.created_at,
+    )
+
 
+@app.get("/results/{task_id}/events")
+async def stream_analysis_progress(task_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Server-sent events with per-stage progress, pushed from the worker through Redis pub/sub
+    (or polled from the database when Redis is down). Sends a snapshot first, then each stage
+    transition, and closes once the job completes.
+    """
+    db_task = await get_task(db, task_id)
     if not db_task:
         raise HTTPException(status_code=404, detail="Task not found")
+    run_task_id = (await resolve_task(db, db_task)).task_id
 
-    if db_task.status == "PENDING":
-        return {"status": "PENDING", "message": "Analysis is still in progress. Please check back later."}
+    # Falls back to polling the stored stages when Redis is unreachable
+    client, pubsub = await subscribe(run_task_id)
+    # Read the snapshot only after subscribing so no transition is missed
+    db.expire_all()
+    db_task = await get_task(db, run_task_id)
+    snapshot = {"task_id": task_id, "status": db_task.status.value, "stages": await load_stages(db, run_task_id)}
 
-    if db_task.status == "FAILURE":
-        return JSONResponse(
-            status_code=500,
-            content={"status": "FAILURE", "result": db_task.result}
-        )
-        
-        # If the task was successful, save the result to a file before returning
-    if db_task.status == "SUCCESS":
+    return StreamingResponse(
+        progress_events(client, pubsub, snapshot, run_task_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/results/{task_id}/sections")
+async def list_result_sections(task_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Lists the sections of a finished report so clients can fetch them individually."""
+    db_task, early_response = await _load_finished_task(task_id, db)
+    if early_response is not None:
+        return early_response
+
+    sections = load_sections(db_task.task_id, db_task.result)
+    return cached_json_response(
+        request,
+        {"status": "SUCCESS", "sections": [{"slug": s["slug"], "title": s["title"]} for s in sections]},
+        etag_for(db_task.result, "sections"),
+        db_task.completed_at or db_task.created_at,
+    )
+
+
+@app.get("/results/{task_id}/sections/{slug}")
+async def get_result_section(task_id: str, slug: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Fetches a single section of a finished report."""
+    db_task, early_response = await _load_finished_task(task_id, db)
+    if early_response is not None:
+        return early_response
+
+    for section in load_sections(db_task.task_id, db_task.result):
+        if section["slug"] == slug:
+            return cached_json_response(
+                request,
+                {"status": "SUCCESS", **section},
+                etag_for(db_task.result, "section", slug),
+                db_task.completed_at or db_task.created_at,
+            )
+    raise HTTPException(status_code=404, detail="Section not found")
+
+
+@app.post("/analyze/batch", status_code=202)
+async def analyze_financial_batch(
+    files: List[UploadFile] = File(default=[]),
+    archive: Optional[UploadFile] = File(default=None),
+    query: str = Form(default="Analyze this financial document for investment insights"),
+    combine: bool = Form(default=False),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Analyzes many PDFs (as repeated `files` fields and/or one zip `archive`) with one shared query.
+    Documents fan out across workers as a Celery group; with `combine`, a chord merges the
+    per-document reports once all have finished.
+    """
+    if len(files) > MAX_BATCH_DOCUMENTS:
+        raise HTTPException(status_code=413, detail=f"A batch may hold at most {MAX_BATCH_DOCUMENTS} documents")
+
+    saved = []
+    try:
+        # 1. Stream every document to disk
+        for upload in files:
+            file_path_obj = _new_upload_path()
+            with span("upload_write"):
+                file_hash, file_size = await save_upload(upload, file_path_obj)
+            saved.append((upload.filename, file_path_obj, file_hash, file_size))
+        if archive is not None:
+            zip_path = UPLOAD_DIRECTORY / f"batch_archive_{uuid.uuid4()}.zip"
+            with span("upload_write"):
+                await save_upload(archive, zip_path, magic=ZIP_MAGIC, max_bytes=MAX_BATCH_UPLOAD_BYTES)
+            try:
+                saved.extend(await asyncio.to_thread(extract_zip_pdfs, zip_path, _new_upload_path))
+            finally:
+                await asyncio.to_thread(os.remove, zip_path)
+        if not saved:
+            raise HTTPException(status_code=400, detail="No PDF documents were uploaded")
+        if len(saved) > MAX_BATCH_DOCUMENTS:
+            raise HTTPException(status_code=413, detail=f"A batch may hold at most {MAX_BATCH_DOCUMENTS} documents")
+
+        # 2. Register the batch and its documents, deduplicating each one
+        batch_id = str(uuid.uuid4())
+        db.add(models.Batch(batch_id=batch_id, query=query, document_count=len(saved), combine=combine))
+        to_run = []
+        for document_name, file_path_obj, file_hash, _ in saved:
+            db_task, existing_task = await _register_document(
+                db, file_path_obj, file_hash, query, batch_id=batch_id, document_name=document_name
+            )
+            if existing_task is None:
+                to_run.append(db_task)
+        with span("db_commit"):
+            await db.commit()
+    except BaseException:
+        for _, file_path_obj, _, _ in saved:
+            if file_path_obj.exists():
+                file_path_obj.unlink()
+        raise
+
+    # 3. Fan out across workers
+    signatures = [analysis_signature(task.task_id, query.strip(), task.file_path, BULK_QUEUE) for task in to_run]
+    with span("enqueue"):
         try:
-            # Ensure the outputs directory exists
-            output_dir = Path("/app/outputs")
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # Define the output file path
-            output_file_path = os.path.join(output_dir, f"{task_id}_result.txt")
-            
-            # Write the analysis result to the text file
-            with open(output_file_path, "w", encoding="utf-8") as f:
-                f.write(db_task.result)
+            if combine:
+                # The combine step itself waits for documents deduplicated onto runs still in progress
+                if signatures:
+                    chord(signatures)(combine_signature(batch_id))
+                else:
+                    combine_signature(batch_id).apply_async()
+            elif signatures:
+                group(signatures).apply_async()
         except Exception as e:
-            # Optional: Log an error if saving fails, but don't block the response
-            print(f"Warning: Could not save result to file for task {task_id}. Error: {e}")
+            await _fail_unqueued(db, to_run, e)
+            raise
+    print(f"Batch {batch_id} queued: {len(signatures)} to run, {len(saved) - len(signatures)} deduplicated")
+
+    return {"message": "Batch has been queued.", "batch_id": batch_id, "document_count": len(saved)}
+
+
+@app.get("/batches/{batch_id}")
+async def get_batch_status(batch_id: str, include_results: bool = False, db: AsyncSession = Depends(get_db)):
+    """
+    Aggregate progress of a batch. Finished documents are available while others are
+    still running; pass include_results=true to inline their reports.
+    """
+    batch = await db.scalar(select(models.Batch).where(models.Batch.batch_id == batch_id))
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    documents = (await db.scalars(
+        select(models.TaskResult).where(models.TaskResult.batch_id == batch_id).order_by(models.TaskResult.id)
+    )).all()
+    counts = {status.value: 0 for status in TaskStatus}
+    entries = []
+    for document in documents:
+        run = await resolve_task(db, document)
+        counts[run.status.value] += 1
+        entry = {"task_id": document.task_id, "document_name": document.document_name, "status": run.status.value}
+        if include_results and run.status != TaskStatus.PENDING:
+            entry["result"] = run.result
+        entries.append(entry)
 
-    return {"status": "SUCCESS", "result": db_task.result}
+    if counts["PENDING"] or (batch.combine and batch.status == TaskStatus.PENDING):
+        status = "PENDING"
+    else:
+        status = "SUCCESS" if counts["SUCCESS"] else "FAILURE"
 
+    response = {
+        "batch_id": batch_id,
+        "status": status,
+        "document_count": batch.document_count,
+        "counts": counts,
+        "documents": entries,
+    }
+    if batch.combined_result is not None:
+        response["combined_result"] = batch.combined_result
+    return response
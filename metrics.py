@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import functools
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest, start_http_server
+
+from dotenv import load_dotenv
+load_dotenv()
+
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+# Also print every span as one JSON line, for ad-hoc debugging of a single job
+METRICS_LOG_SPANS = os.getenv("METRICS_LOG_SPANS", "false").lower() == "true"
+
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+_SLOW_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+SPAN_SECONDS = Histogram(
+    "analyzer_span_seconds", "Duration of hot-path operations (upload write, DB commit, enqueue, ...)",
+    ["span", "outcome"], buckets=_FAST_BUCKETS + _SLOW_BUCKETS[7:],
+)
+PAGE_EXTRACTION_SECONDS = Histogram(
+    "analyzer_pdf_page_extraction_seconds", "Text extraction time of a single PDF page", buckets=_FAST_BUCKETS,
+)
+PAGES_EXTRACTED = Counter("analyzer_pdf_pages_extracted_total", "PDF pages whose text was extracted")
+TOOL_SECONDS = Histogram(
+    "analyzer_tool_seconds", "Duration of agent tool runs", ["tool", "outcome"], buckets=_FAST_BUCKETS + _SLOW_BUCKETS[7:],
+)
+STAGE_SECONDS = Histogram(
+    "analyzer_stage_seconds", "Duration of pipeline stages (one agent and task each, plus extraction)",
+    ["stage", "outcome"], buckets=_SLOW_BUCKETS,
+)
+LLM_CALL_SECONDS = Histogram(
+    "analyzer_llm_call_seconds", "Duration of LLM calls; source is api or cache",
+    ["model", "source", "outcome"], buckets=_SLOW_BUCKETS,
+)
+LLM_TOKENS = Counter("analyzer_llm_tokens_total", "Tokens reported by the LLM provider", ["model", "kind"])
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """Observe the block's duration under `labels`, with outcome="error" if it raised."""
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        histogram.labels(outcome=outcome, **labels).observe(seconds)
+        if METRICS_LOG_SPANS:
+            print(json.dumps({"metric": histogram._name, **labels, "outcome": outcome, "seconds": round(seconds, 6)}))
+
+
+def span(name: str):
+    """Time a named hot-path operation."""
+    return timed(SPAN_SECONDS, span=name)
+
+
+def instrument_tool(run):
+    """Decorate a tool's `_run` so every call is timed under the tool's name."""
+    @functools.wraps(run)
+    def wrapper(self, *args, **kwargs):
+        with timed(TOOL_SECONDS, tool=self.name):
+            return run(self, *args, **kwargs)
+    return wrapper
+
+
+# Page timings measured in a CPU pool process, whose registry nobody scrapes; run_cpu
+# returns them with the job's result and the parent records them
+_pool_child_pages = None
+
+
+def buffer_pages_in_pool_child():
+    global _pool_child_pages
+    _pool_child_pages = []
+
+
+def drain_pool_child_pages() -> list:
+    global _pool_child_pages
+    durations, _pool_child_pages = _pool_child_pages or [], []
+    return durations
+
+
+def observe_pages(durations):
+    """Record per-page extraction times (measured wherever the page was extracted)."""
+    if _pool_child_pages is not None:
+        _pool_child_pages.extend(durations)
+        return
+    for seconds in durations:
+        PAGE_EXTRACTION_SECONDS.observe(seconds)
+    PAGES_EXTRACTED.inc(len(durations))
+
+
+def _record_llm_usage(kwargs, completion_response, start_time, end_time):
+    """litellm success callback: count prompt and completion tokens per model."""
+    usage = getattr(completion_response, "usage", None)
+    if usage is None:
+        return
+    model = kwargs.get("model", "unknown")
+    LLM_TOKENS.labels(model=model, kind="prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(model=model, kind="completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def install_llm_usage_callback():
+    # crewai only swaps callbacks of its own types, so a plain function here survives per-call setup
+    import litellm
+    if _record_llm_usage not in litellm.success_callback:
+        litellm.success_callback.append(_record_llm_usage)
+
+
+def render_latest():
+    """Prometheus text exposition of this process's metrics: (body, content type)."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def start_worker_exporter(port: int = WORKER_METRICS_PORT):
+    """Serve the worker's metrics on their own port; the worker has no HTTP app of its own."""
+    start_http_server(port)
+    print(f"Worker metrics exporter listening on port {port}")
@@ -1,11 +1,82 @@
-from sqlalchemy import Column, Integer, String, Text
+import enum
+from datetime import datetime
+from sqlalchemy import Boolean, Column, DateTime, Enum, Float, Index, Integer, LargeBinary, String, Text, UniqueConstraint, text
 from database import Base
+from compression import compressed_text
+
+
+class TaskStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    SUCCESS = "SUCCESS"
+    FAILURE = "FAILURE"
+
 
 class TaskResult(Base):
     __tablename__ = "task_results"
 
     id = Column(Integer, primary_key=True, index=True)
     task_id = Column(String, unique=True, index=True)
-    status = Column(String, default="PENDING")
+    status = Column(Enum(TaskStatus, native_enum=False, length=16), default=TaskStatus.PENDING, nullable=False, index=True)
     file_path = Column(String)
-    result = Column(Text, nullable=True)
+    # Report text, compressed (see compression.RESULT_CODEC); read and assign it through `result`
+    result_data = Column(LargeBinary, nullable=True)
+    result_codec = Column(String(8), nullable=True)
+    result = compressed_text("result_data", "result_codec")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+    # Deduplication key: identical (file, query, pipeline) submissions share one run
+    file_hash = Column(String(64), nullable=True)
+    query_hash = Column(String(64), nullable=True)
+    pipeline_version = Column(String, nullable=True)
+    # Set when this task was answered by (or attached to) another task's run
+    duplicate_of = Column(String, nullable=True, index=True)
+
+    # Batch membership for /analyze/batch submissions
+    batch_id = Column(String, nullable=True, index=True)
+    document_name = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_task_results_dedup_key", "file_hash", "query_hash", "pipeline_version"),
+        # At most one running canonical run per dedup key, so simultaneous identical uploads cannot both start one
+        Index(
+            "uq_task_results_running_dedup_key", "file_hash", "query_hash", "pipeline_version",
+            unique=True,
+            sqlite_where=text("status = 'PENDING' AND duplicate_of IS NULL"),
+            postgresql_where=text("status = 'PENDING' AND duplicate_of IS NULL"),
+        ),
+        # Supports listing jobs by state in creation order, and retention sweeps
+        Index("ix_task_results_status_created_at", "status", "created_at"),
+    )
+
+
+class TaskStage(Base):
+    __tablename__ = "task_stages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(String, index=True)
+    stage = Column(String)
+    status = Column(String, default="RUNNING")
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("task_id", "stage", name="uq_task_stages_task_stage"),
+    )
+
+
+class Batch(Base):
+    __tablename__ = "batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(String, unique=True, index=True)
+    status = Column(Enum(TaskStatus, native_enum=False, length=16), default=TaskStatus.PENDING, nullable=False, index=True)
+    query = Column(Text)
+    document_count = Column(Integer, default=0)
+    combine = Column(Boolean, default=False)
+    combined_result_data = Column(LargeBinary, nullable=True)
+    combined_result_codec = Column(String(8), nullable=True)
+    combined_result = compressed_text("combined_result_data", "combined_result_codec")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
@@ -0,0 +1,273 @@
+import os
+import time
+import sqlite3
+import difflib
+import hashlib
+import threading
+from contextlib import closing, contextmanager
+from pathlib import Path
+import pypdf
+from document_cache import CACHE_DIRECTORY
+
+from dotenv import load_dotenv
+load_dotenv()
+
+PAGE_STORE_PATH = Path(os.getenv("PAGE_STORE_PATH", str(CACHE_DIRECTORY / "pages.sqlite3")))
+PAGE_STORE_MAX_BYTES = int(os.getenv("PAGE_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+# An earlier upload counts as a revision of a new one when at least this share of its pages recur
+REVISION_MIN_SHARED_FRACTION = float(os.getenv("REVISION_MIN_SHARED_FRACTION", "0.5"))
+# How much of the earlier revision's report is handed to the agents
+REVISION_REPORT_CHARS = int(os.getenv("REVISION_REPORT_CHARS", "3000"))
+
+# Bump when the page text transform changes so stored pages are not reused across versions
+PAGE_TEXT_VERSION = "1"
+HEADING_CHARS = 80
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def page_heading(text: str) -> str:
+    """First non-empty line of a page, which is usually its section heading."""
+    for line in text.splitlines():
+        if line.strip():
+            return line.strip()[:HEADING_CHARS]
+    return ""
+
+
+def build_manifest(pages: list) -> list:
+    """[(text_hash, heading)] per page."""
+    return [(text_hash(page), page_heading(page)) for page in pages]
+
+
+class PageStore:
+    """
+    SQLite store of per-page artifacts shared by every document revision:
+
+    - pages: normalized text per page content fingerprint, so a new upload only
+      extracts the pages that changed (size-bounded, least recently used first out)
+    - manifests: the ordered page text hashes and headings of every analyzed document,
+      indexed by text hash to find the closest earlier revision of a new upload
+    """
+
+    def __init__(self, path: Path = PAGE_STORE_PATH, max_bytes: int = PAGE_STORE_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.execute(
+                            "CREATE TABLE IF NOT EXISTS pages ("
+                            "fingerprint TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, "
+                            "last_used REAL NOT NULL)"
+                        )
+                        conn.execute("CREATE INDEX IF NOT EXISTS ix_pages_last_used ON pages (last_used)")
+                        conn.execute(
+                            "CREATE TABLE IF NOT EXISTS manifests ("
+                            "doc_hash TEXT PRIMARY KEY, page_count INTEGER NOT NULL, created_at REAL NOT NULL)"
+                        )
+                        conn.execute(
+                            "CREATE TABLE IF NOT EXISTS manifest_pages ("
+                            "doc_hash TEXT NOT NULL, page_number INTEGER NOT NULL, text_hash TEXT NOT NULL, "
+                            "heading TEXT NOT NULL, PRIMARY KEY (doc_hash, page_number))"
+                        )
+                        conn.execute("CREATE INDEX IF NOT EXISTS ix_manifest_pages_text_hash ON manifest_pages (text_hash)")
+                    self._initialized = True
+        # One short-lived connection per call keeps this safe across threads and green threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    @contextmanager
+    def _transaction(self):
+        with closing(self._connect()) as conn:
+            with conn:
+                yield conn
+
+    @staticmethod
+    def _key(fingerprint: str) -> str:
+        # Another pypdf release may extract the same page differently
+        return f"{PAGE_TEXT_VERSION}:{pypdf.__version__}:{fingerprint}"
+
+    def known_pages(self, fingerprints: list) -> set:
+        """The fingerprints already in the store, without reading their text."""
+        keys = {self._key(fp): fp for fp in set(fingerprints)}
+        known = set()
+        with self._transaction() as conn:
+            key_list = list(keys)
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for (key,) in conn.execute(f"SELECT fingerprint FROM pages WHERE fingerprint IN ({placeholders})", batch):
+                    known.add(keys[key])
+        return known
+
+    def get_pages(self, fingerprints: list) -> dict:
+        """Return {fingerprint: text} for the fingerprints already in the store."""
+        keys = {self._key(fp): fp for fp in set(fingerprints)}
+        found = {}
+        with self._transaction() as conn:
+            key_list = list(keys)
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, text in conn.execute(f"SELECT fingerprint, text FROM pages WHERE fingerprint IN ({placeholders})", batch):
+                    found[keys[key]] = text
+                conn.execute(f"UPDATE pages SET last_used = ? WHERE fingerprint IN ({placeholders})", [time.time(), *batch])
+        return found
+
+    def put_pages(self, pages: dict):
+        """Store {fingerprint: text} and evict least recently used pages past the size limit."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO pages (fingerprint, text, size, last_used) VALUES (?, ?, ?, ?)",
+                [(self._key(fp), text, len(text.encode("utf-8")), now) for fp, text in pages.items()],
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            if total > self.max_bytes:
+                for key, size in conn.execute("SELECT fingerprint, size FROM pages ORDER BY last_used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM pages WHERE fingerprint = ?", (key,))
+                    total -= size
+
+    def record_manifest(self, doc_hash: str, manifest: list):
+        """Remember a document's page sequence; a no-op if it is already known."""
+        with self._transaction() as conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO manifests (doc_hash, page_count, created_at) VALUES (?, ?, ?)",
+                (doc_hash, len(manifest), time.time()),
+            ).rowcount
+            if inserted:
+                conn.executemany(
+                    "INSERT INTO manifest_pages (doc_hash, page_number, text_hash, heading) VALUES (?, ?, ?, ?)",
+                    [(doc_hash, number, page_hash, heading) for number, (page_hash, heading) in enumerate(manifest, start=1)],
+                )
+
+    def load_manifest(self, doc_hash: str) -> list:
+        """[(text_hash, heading)] per page of a recorded document, in page order."""
+        with self._transaction() as conn:
+            return conn.execute(
+                "SELECT text_hash, heading FROM manifest_pages WHERE doc_hash = ? ORDER BY page_number", (doc_hash,)
+            ).fetchall()
+
+    def prune_manifests(self, older_than: float) -> int:
+        """Forget manifests recorded before `older_than` (epoch seconds); returns how many."""
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM manifest_pages WHERE doc_hash IN (SELECT doc_hash FROM manifests WHERE created_at < ?)",
+                (older_than,),
+            )
+            return conn.execute("DELETE FROM manifests WHERE created_at < ?", (older_than,)).rowcount
+
+    def closest_revision(self, doc_hash: str, hashes: list):
+        """The recorded document sharing the most page texts with `hashes`, as (doc_hash, shared pages), or None."""
+        distinct = list(set(hashes))
+        if not distinct:
+            return None
+        shared = {}
+        with self._transaction() as conn:
+            for start in range(0, len(distinct), 500):
+                batch = distinct[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT doc_hash, COUNT(DISTINCT text_hash) FROM manifest_pages "
+                    f"WHERE text_hash IN ({placeholders}) AND doc_hash != ? GROUP BY doc_hash",
+                    [*batch, doc_hash],
+                )
+                for other, count in rows:
+                    shared[other] = shared.get(other, 0) + count
+        if not shared:
+            return None
+        best, count = max(shared.items(), key=lambda item: item[1])
+        if count < REVISION_MIN_SHARED_FRACTION * len(distinct):
+            return None
+        return best, count
+
+
+def _page_span(start: int, stop: int) -> str:
+    """1-based label for the 0-based page range [start, stop)."""
+    return f"page {start + 1}" if stop - start == 1 else f"pages {start + 1}-{stop}"
+
+
+def _headings(headings: list) -> str:
+    named = [h for h in dict.fromkeys(headings) if h]
+    if not named:
+        return ""
+    shown = "; ".join(f'"{h}"' for h in named[:3])
+    return f" ({shown}{'; ...' if len(named) > 3 else ''})"
+
+
+def diff_revisions(old: list, new: list) -> tuple:
+    """
+    Compare two manifests ([(text_hash, heading)] per page) page by page.
+    Returns (change lines with page numbers of the new revision, number of unchanged pages).
+    """
+    matcher = difflib.SequenceMatcher(None, [h for h, _ in old], [h for h, _ in new], autojunk=False)
+    changes = []
+    unchanged = 0
+    for tag, old_start, old_stop, new_start, new_stop in matcher.get_opcodes():
+        if tag == "equal":
+            unchanged += new_stop - new_start
+        elif tag == "replace":
+            changes.append(f"Changed: {_page_span(new_start, new_stop)}{_headings([h for _, h in new[new_start:new_stop]])}")
+        elif tag == "insert":
+            changes.append(f"Added: {_page_span(new_start, new_stop)}{_headings([h for _, h in new[new_start:new_stop]])}")
+        elif tag == "delete":
+            changes.append(
+                f"Removed: {_page_span(old_start, old_stop)} of the earlier revision"
+                f"{_headings([h for _, h in old[old_start:old_stop]])}"
+            )
+    return changes, unchanged
+
+
+def find_revision(doc_hash: str, pages: list):
+    """
+    Record this document's manifest and compare it with the closest earlier revision.
+    Returns {"doc_hash", "shared_pages", "page_count", "changes"} or None if there is none.
+    """
+    manifest = build_manifest(pages)
+    page_store.record_manifest(doc_hash, manifest)
+    match = page_store.closest_revision(doc_hash, [page_hash for page_hash, _ in manifest])
+    if match is None:
+        return None
+    previous_hash, _ = match
+    changes, unchanged = diff_revisions(page_store.load_manifest(previous_hash), manifest)
+    return {
+        "doc_hash": previous_hash,
+        "shared_pages": unchanged,
+        "page_count": len(manifest),
+        "changes": changes,
+    }
+
+
+NO_REVISION_SUMMARY = "Revision context: no earlier revision of this document has been analyzed; every page is new."
+
+
+def format_change_summary(revision: dict, previous_report: str = None) -> str:
+    """The revision context handed to every agent through the `change_summary` input."""
+    if revision is None:
+        return NO_REVISION_SUMMARY
+    lines = [
+        f"Revision context: this document revises one analyzed before; {revision['shared_pages']} of its "
+        f"{revision['page_count']} pages are unchanged. Concentrate on the pages listed below and carry the "
+        "earlier conclusions forward for everything else.",
+    ]
+    lines.extend(f"- {change}" for change in revision["changes"] or ["No page text changed."])
+    if previous_report:
+        excerpt = previous_report[:REVISION_REPORT_CHARS]
+        if len(previous_report) > REVISION_REPORT_CHARS:
+            excerpt += "\n[...]"
+        lines.extend(["", "Earlier analysis (excerpt):", excerpt])
+    return "\n".join(lines)
+
+
+page_store = PageStore()
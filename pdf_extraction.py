@@ -0,0 +1,155 @@
+import os
+import time
+import hashlib
+from collections import deque
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from cpu_pool import CPU_WORKERS, get_executor, in_pool_child, offload_enabled
+from metrics import observe_pages
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Documents shorter than this are extracted serially; process start-up would cost more than it saves.
+# When CPU work is offloaded (see cpu_pool.py) every document goes to the pool.
+PARALLEL_MIN_PAGES = int(os.getenv("PARALLEL_EXTRACTION_MIN_PAGES", "40"))
+PAGES_PER_RANGE = int(os.getenv("EXTRACTION_PAGES_PER_RANGE", "16"))
+
+
+def _identity(text: str) -> str:
+    return text
+
+
+def _extract_page(page, transform) -> tuple:
+    started = time.perf_counter()
+    text = transform(page.extract_text() or "")
+    return text, time.perf_counter() - started
+
+
+def _extract_range(file_path: str, indices: list, transform) -> list:
+    """
+    Extract the given pages in a child process; each child opens the file itself.
+    Returns (text, seconds) per page so the parent can record the timings.
+    """
+    reader = PdfReader(file_path)
+    return [_extract_page(reader.pages[i], transform) for i in indices]
+
+
+def _collect(results: list) -> list:
+    observe_pages([seconds for _, seconds in results])
+    return [text for text, _ in results]
+
+
+def page_ranges(indices: list, size: int = PAGES_PER_RANGE):
+    """Split page indices into consecutive batches of at most `size` pages."""
+    return [indices[start:start + size] for start in range(0, len(indices), size)]
+
+
+def iter_pages(file_path: str, transform=_identity, indices: list = None):
+    """
+    Yield the text of every page (or only the given page indices), in order, as it is extracted.
+
+    Large documents are split into page ranges and extracted on the CPU pool.
+    At most two ranges per pool process are in flight at once, so memory stays bounded
+    however long the document is. `transform` must be a module-level function so
+    it can be sent to the children.
+    """
+    reader = PdfReader(file_path)
+    indices = list(range(len(reader.pages)) if indices is None else indices)
+    parallel = len(indices) >= PARALLEL_MIN_PAGES and CPU_WORKERS >= 2 and not in_pool_child()
+    if not (parallel or offload_enabled() and indices):
+        for i in indices:
+            yield from _collect([_extract_page(reader.pages[i], transform)])
+        return
+    del reader
+
+    executor = get_executor()
+    pending = deque(page_ranges(indices))
+    in_flight = deque()
+    try:
+        while pending or in_flight:
+            while pending and len(in_flight) < CPU_WORKERS * 2:
+                in_flight.append(executor.submit(_extract_range, file_path, pending.popleft(), transform))
+            # Collect in submission order to keep the pages in document order
+            yield from _collect(in_flight.popleft().result())
+    finally:
+        # A consumer that stops early should not leave queued ranges behind
+        for future in in_flight:
+            future.cancel()
+
+
+def extract_pages(file_path: str, transform=_identity, indices: list = None) -> list:
+    """Extract the text of every page (or only the given page indices), in order."""
+    return list(iter_pages(file_path, transform, indices))
+
+
+def page_count(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+
+def _stream_data(obj) -> bytes:
+    try:
+        return obj.get_object().get_data()
+    except Exception:
+        return b""
+
+
+# Resource entries that point back up the page tree rather than describing the resource
+_SKIPPED_KEYS = {"/Parent", "/Length"}
+MAX_RESOURCE_DEPTH = 16
+
+
+def _canonical(obj, memo: dict, depth: int = 0) -> str:
+    """
+    Stable text form of a PDF object with indirect references resolved and streams hashed,
+    so two objects with the same content give the same string wherever they live.
+    Resolved references are memoized per document; fonts are shared by many pages.
+    """
+    if depth > MAX_RESOURCE_DEPTH:
+        return "..."
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in memo:
+            memo[key] = "cycle"
+            memo[key] = _canonical(obj.get_object(), memo, depth + 1)
+        return memo[key]
+    if isinstance(obj, StreamObject):
+        entries = _canonical(DictionaryObject({k: v for k, v in obj.items()}), memo, depth + 1)
+        return f"stream({hashlib.sha256(_stream_data(obj)).hexdigest()},{entries})"
+    if isinstance(obj, DictionaryObject):
+        items = sorted((str(k), v) for k, v in obj.items() if k not in _SKIPPED_KEYS)
+        return "{" + ",".join(f"{k}:{_canonical(v, memo, depth + 1)}" for k, v in items) + "}"
+    if isinstance(obj, ArrayObject):
+        return "[" + ",".join(_canonical(v, memo, depth + 1) for v in obj) + "]"
+    return repr(obj)
+
+
+def _page_fingerprint(page, memo: dict = None) -> str:
+    """
+    Hash of everything text extraction reads from a page: its content stream, rotation and
+    boxes, and the fully resolved fonts (encodings, widths, unicode maps, embedded font files)
+    and form XObjects. For one pypdf version, equal fingerprints mean equal extracted text;
+    the page store keys on both.
+    """
+    memo = {} if memo is None else memo
+    digest = hashlib.sha256()
+    contents = page.get_contents()
+    digest.update(contents.get_data() if contents is not None else b"")
+    # Inherited from the page tree when the page does not set them itself
+    digest.update(f"rotate:{page.rotation};media:{list(page.mediabox)};crop:{list(page.cropbox)}".encode())
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else {}
+    fonts = resources.get("/Font")
+    for name, font in sorted((fonts.get_object() if fonts is not None else {}).items()):
+        digest.update(f"{name}:{_canonical(font, memo)}".encode())
+    xobjects = resources.get("/XObject")
+    for name, xobject in sorted((xobjects.get_object() if xobjects is not None else {}).items()):
+        if xobject.get_object().get("/Subtype") == "/Form":
+            digest.update(f"{name}:{_canonical(xobject, memo)}".encode())
+    return digest.hexdigest()
+
+
+def page_fingerprints(file_path: str) -> list:
+    """Per-page content fingerprints, computed without extracting any text."""
+    memo = {}
+    return [_page_fingerprint(page, memo) for page in PdfReader(file_path).pages]
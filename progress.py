@@ -0,0 +1,204 @@
+import os
+import json
+import asyncio
+from datetime import datetime
+import redis
+import redis.asyncio as aioredis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database import AsyncSessionLocal, SessionLocal
+import models
+
+from dotenv import load_dotenv
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+SSE_MAX_STREAM_SECONDS = float(os.getenv("SSE_MAX_STREAM_SECONDS", "3600"))
+# Without Redis the stream falls back to reading the stored stages this often
+SSE_POLL_SECONDS = float(os.getenv("SSE_POLL_SECONDS", "2"))
+
+STAGES = ("queued", "extraction", "admission", "fact_sheet", "financial_analysis", "risk_assessment", "investment_analysis", "cross_check", "verification")
+TERMINAL_STATUSES = ("SUCCESS", "FAILURE")
+# Opened when the API enqueues a run and closed when a worker picks it up
+QUEUED_STAGE = "queued"
+QUEUED_STATUS = "QUEUED"
+
+_publisher = None
+
+
+def progress_channel(task_id: str) -> str:
+    return f"progress:{task_id}"
+
+
+def _publish(task_id: str, event: dict):
+    global _publisher
+    if _publisher is None:
+        _publisher = redis.Redis.from_url(REDIS_URL)
+    try:
+        _publisher.publish(progress_channel(task_id), json.dumps(event))
+    except redis.RedisError as e:
+        # Progress is best effort; clients still see the final state through /results
+        print(f"Warning: Could not publish progress for task {task_id}. Error: {e}")
+
+
+def stage_to_dict(stage: models.TaskStage) -> dict:
+    return {
+        "stage": stage.stage,
+        "status": stage.status,
+        "started_at": stage.started_at.isoformat() if stage.started_at else None,
+        "finished_at": stage.finished_at.isoformat() if stage.finished_at else None,
+        "duration_seconds": stage.duration_seconds,
+    }
+
+
+def record_stage(task_id: str, stage: str, status: str, duration_seconds: float = None):
+    """Persist a stage transition (RUNNING, WAITING, SUCCESS, SKIPPED or FAILURE) and push it to subscribers."""
+    db: Session = SessionLocal()
+    try:
+        row = db.query(models.TaskStage).filter(
+            models.TaskStage.task_id == task_id, models.TaskStage.stage == stage
+        ).first()
+        if row is None:
+            row = models.TaskStage(task_id=task_id, stage=stage)
+            db.add(row)
+        row.status = status
+        if status == "RUNNING":
+            row.started_at = datetime.utcnow()
+        else:
+            row.finished_at = datetime.utcnow()
+            if duration_seconds is None and row.started_at is not None:
+                # Waits (queued, admission) last from when the stage was opened
+                duration_seconds = (row.finished_at - row.started_at).total_seconds()
+            row.duration_seconds = duration_seconds
+        db.commit()
+        event = {"event": "stage", **stage_to_dict(row)}
+    finally:
+        db.close()
+    _publish(task_id, event)
+
+
+def record_partial_result(task_id: str, text: str, section: str):
+    """
+    Store the report-so-far on a running job and tell subscribers a section is ready.
+    Only PENDING jobs are touched, so a late write never overwrites a final result.
+    """
+    db: Session = SessionLocal()
+    try:
+        db_task = db.query(models.TaskResult).filter(
+            models.TaskResult.task_id == task_id, models.TaskResult.status == models.TaskStatus.PENDING
+        ).first()
+        if db_task is None:
+            return
+        db_task.result = text
+        db.commit()
+    finally:
+        db.close()
+    _publish(task_id, {"event": "section", "section": section})
+
+
+def publish_completion(task_id: str, status: str):
+    """Tell subscribers the job reached a terminal state; sent after the status is committed."""
+    _publish(task_id, {"event": "complete", "status": status})
+
+
+async def load_stages(db: AsyncSession, task_id: str) -> list:
+    rows = (await db.scalars(select(models.TaskStage).where(models.TaskStage.task_id == task_id))).all()
+    order = {name: i for i, name in enumerate(STAGES)}
+    return [stage_to_dict(row) for row in sorted(rows, key=lambda row: order.get(row.stage, len(order)))]
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def subscribe(task_id: str):
+    """
+    Subscribe before reading the snapshot so no transition can fall between the two.
+    Returns (client, pubsub), or (None, None) when Redis is unreachable.
+    """
+    client = aioredis.Redis.from_url(REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(progress_channel(task_id))
+    except redis.RedisError as e:
+        print(f"Warning: Could not subscribe to progress for task {task_id}; polling instead. Error: {e}")
+        await _close(client, pubsub)
+        return None, None
+    return client, pubsub
+
+
+async def _close(client, pubsub):
+    try:
+        await pubsub.aclose()
+        await client.aclose()
+    except redis.RedisError:
+        pass
+
+
+async def _poll_events(task_id: str, stages: list, deadline: float):
+    """Stage transitions read from the database, for when pub/sub is unavailable."""
+    seen = {stage["stage"]: stage for stage in stages}
+    loop = asyncio.get_running_loop()
+    last_sent = loop.time()
+    while loop.time() < deadline:
+        await asyncio.sleep(SSE_POLL_SECONDS)
+        async with AsyncSessionLocal() as db:
+            status = await db.scalar(select(models.TaskResult.status).where(models.TaskResult.task_id == task_id))
+            stages = await load_stages(db, task_id)
+        for stage in stages:
+            if seen.get(stage["stage"]) != stage:
+                seen[stage["stage"]] = stage
+                last_sent = loop.time()
+                yield _sse("stage", {"event": "stage", **stage})
+        if status is None or status.value in TERMINAL_STATUSES:
+            yield _sse("complete", {"event": "complete", "status": status.value if status else "FAILURE"})
+            return
+        if loop.time() - last_sent >= SSE_KEEPALIVE_SECONDS:
+            last_sent = loop.time()
+            yield ": keepalive\n\n"
+
+
+async def progress_events(client, pubsub, snapshot: dict, task_id: str):
+    """
+    Server-sent events: one snapshot, then every stage transition until the job completes.
+    Transitions come from Redis pub/sub; without it (no client, or the connection drops)
+    they are polled from the stored stages of `task_id`, the run being watched.
+    """
+    try:
+        yield _sse("snapshot", snapshot)
+        if snapshot["status"] in TERMINAL_STATUSES:
+            yield _sse("complete", {"event": "complete", "status": snapshot["status"]})
+            return
+
+        deadline = asyncio.get_running_loop().time() + SSE_MAX_STREAM_SECONDS
+        stages = snapshot["stages"]
+        polling = pubsub is None
+        while not polling and asyncio.get_running_loop().time() < deadline:
+            try:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SSE_KEEPALIVE_SECONDS)
+            except redis.RedisError as e:
+                print(f"Warning: Lost the progress subscription for task {task_id}; polling instead. Error: {e}")
+                polling = True
+                break
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            event = json.loads(message["data"])
+            yield _sse(event["event"], event)
+            if event["event"] == "complete":
+                return
+            if event["event"] == "stage":
+                # Remembered so a switch to polling does not repeat transitions already sent
+                stages = [s for s in stages if s["stage"] != event["stage"]] + [{k: v for k, v in event.items() if k != "event"}]
+        if polling:
+            async for chunk in _poll_events(task_id, stages, deadline):
+                yield chunk
+    finally:
+        if pubsub is not None:
+            try:
+                await pubsub.unsubscribe()
+            except redis.RedisError:
+                pass
+            await _close(client, pubsub)
@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+from dotenv import load_dotenv
+load_dotenv()
+
+OUTPUT_DIRECTORY = Path(os.getenv("OUTPUT_DIR", "/app/outputs"))
+MIN_COMPRESS_BYTES = 1024
+MEMORY_BODIES = 256
+
+_HEADING = re.compile(r"^#{1,2}\s+(.+?)\s*#*\s*$", re.M)
+
+
+def _slugify(title: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-") or "section"
+
+
+def split_sections(text: str) -> list:
+    """Split a markdown report on its level 1-2 headings into [{slug, title, content}]."""
+    sections = []
+    matches = list(_HEADING.finditer(text))
+    if not matches or matches[0].start() > 0 and text[:matches[0].start()].strip():
+        end = matches[0].start() if matches else len(text)
+        sections.append({"slug": "preamble", "title": "Preamble", "content": text[:end].strip()})
+    seen = set()
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        slug = base = _slugify(match.group(1))
+        counter = 2
+        while slug in seen:
+            slug = f"{base}-{counter}"
+            counter += 1
+        seen.add(slug)
+        sections.append({"slug": slug, "title": match.group(1), "content": text[match.end():end].strip()})
+    return sections
+
+
+def result_path(task_id: str) -> Path:
+    return OUTPUT_DIRECTORY / f"{task_id}_result.txt"
+
+
+def sections_path(task_id: str) -> Path:
+    return OUTPUT_DIRECTORY / f"{task_id}_sections.json"
+
+
+def _write_atomic(path: Path, data: str):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_result_artifact(task_id: str, text: str):
+    """Materialize the report and its sections once, when the job finishes."""
+    OUTPUT_DIRECTORY.mkdir(parents=True, exist_ok=True)
+    _write_atomic(result_path(task_id), text)
+    _write_atomic(sections_path(task_id), json.dumps(split_sections(text)))
+
+
+def load_sections(task_id: str, text: str) -> list:
+    """Read the stored sections, writing them first for results finished before sections existed."""
+    try:
+        with open(sections_path(task_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    try:
+        write_result_artifact(task_id, text)
+    except OSError as e:
+        print(f"Warning: Could not save result to file for task {task_id}. Error: {e}")
+    return split_sections(text)
+
+
+def etag_for(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def _accepted_encodings(accept_encoding: str) -> dict:
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    accepted = _accepted_encodings(accept_encoding or "")
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return "identity"
+
+
+_bodies = OrderedDict()
+_bodies_lock = threading.Lock()
+
+
+def _encoded_body(etag: str, body: bytes, encoding: str) -> bytes:
+    """Compress once per (ETag, encoding); repeated polls reuse the compressed bytes."""
+    key = (etag, encoding)
+    with _bodies_lock:
+        if key in _bodies:
+            _bodies.move_to_end(key)
+            return _bodies[key]
+    if encoding == "br":
+        encoded = brotli.compress(body, quality=5)
+    else:
+        encoded = gzip.compress(body, compresslevel=6)
+    with _bodies_lock:
+        _bodies[key] = encoded
+        while len(_bodies) > MEMORY_BODIES:
+            _bodies.popitem(last=False)
+    return encoded
+
+
+def _representation_etag(etag: str, encoding: str) -> str:
+    """A strong ETag names one byte sequence, so each content coding gets its own tag."""
+    if encoding == "identity":
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _opaque_tag(tag: str) -> str:
+    # If-None-Match uses the weak comparison
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        return _opaque_tag(etag) in [_opaque_tag(tag) for tag in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cached_json_response(request: Request, payload: dict, etag: str, last_modified: datetime = None) -> Response:
+    """
+    JSON response with ETag/Last-Modified validators, 304 on a conditional
+    match, and brotli or gzip encoding when the client accepts it. The ETag is
+    suffixed with the negotiated encoding.
+    """
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    representation_etag = _representation_etag(etag, encoding)
+    headers = {"ETag": representation_etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if _not_modified(request, representation_etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    body = json.dumps(payload).encode("utf-8")
+    if encoding != "identity" and len(body) >= MIN_COMPRESS_BYTES:
+        body = _encoded_body(etag, body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,214 @@
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine
+from dedup import settle_duplicates
+from document_cache import CACHE_DIRECTORY, DISK_LIMIT_BYTES, DISK_PATTERN, evict_directory
+from page_store import page_store
+from result_store import OUTPUT_DIRECTORY
+from uploads import UPLOAD_DIRECTORY
+import models
+from models import TaskStatus
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Finished jobs, their reports and their revision manifests are kept this long
+RESULT_RETENTION_DAYS = float(os.getenv("RESULT_RETENTION_DAYS", "30"))
+# Compressed report bytes kept in the database; the oldest finished jobs go first
+RESULTS_MAX_BYTES = int(os.getenv("RESULTS_MAX_BYTES", str(1024 * 1024 * 1024)))
+OUTPUTS_MAX_BYTES = int(os.getenv("OUTPUTS_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# PENDING jobs with no stage activity (including budget waits) for this long lost their worker and are marked failed
+STALE_JOB_HOURS = float(os.getenv("STALE_JOB_HOURS", "24"))
+# Files younger than this may belong to a request that has not committed its row yet
+ORPHAN_GRACE_SECONDS = int(os.getenv("ORPHAN_GRACE_SECONDS", "3600"))
+# SQLite only gives space back to the filesystem on VACUUM, which locks the database
+VACUUM_MIN_DELETED_ROWS = int(os.getenv("VACUUM_MIN_DELETED_ROWS", "1000"))
+
+UPLOAD_PATTERNS = ("financial_document_*.pdf", "batch_archive_*.zip")
+OUTPUT_SUFFIXES = ("_result.txt", "_sections.json")
+ID_BATCH_SIZE = 500
+
+
+def _delete_tasks(db: Session, task_ids: list) -> int:
+    """Delete jobs with their stages and the deduplicated jobs whose report they held."""
+    deleted = 0
+    for start in range(0, len(task_ids), ID_BATCH_SIZE):
+        batch = task_ids[start:start + ID_BATCH_SIZE]
+        duplicates = [row.task_id for row in db.query(models.TaskResult.task_id).filter(models.TaskResult.duplicate_of.in_(batch))]
+        ids = batch + duplicates
+        db.query(models.TaskStage).filter(models.TaskStage.task_id.in_(ids)).delete(synchronize_session=False)
+        deleted += db.query(models.TaskResult).filter(models.TaskResult.task_id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def expire_stale_jobs(db: Session, now: datetime) -> int:
+    """
+    Fail PENDING jobs that have shown no sign of life for STALE_JOB_HOURS. Every stage
+    transition counts, and so does each retry of a job waiting for the LLM budget, which
+    records an `admission` stage; old but active jobs are left alone. Deduplicated jobs
+    whose run has finished take its status instead.
+    """
+    settle_duplicates(db)
+    cutoff = now - timedelta(hours=STALE_JOB_HOURS)
+    active = db.query(models.TaskStage.task_id).filter(
+        or_(models.TaskStage.started_at >= cutoff, models.TaskStage.finished_at >= cutoff)
+    )
+    stale = db.query(models.TaskResult).filter(
+        models.TaskResult.status == TaskStatus.PENDING,
+        models.TaskResult.created_at < cutoff,
+        models.TaskResult.task_id.not_in(active),
+        # Deduplicated jobs live as long as the run they are attached to
+        or_(models.TaskResult.duplicate_of.is_(None), models.TaskResult.duplicate_of.not_in(active)),
+    ).all()
+    for task in stale:
+        task.status = TaskStatus.FAILURE
+        task.result = f"Job abandoned: no worker activity within {STALE_JOB_HOURS:g} hours"
+        task.completed_at = now
+    db.commit()
+    return len(stale)
+
+
+def expire_results(db: Session, now: datetime) -> int:
+    cutoff = now - timedelta(days=RESULT_RETENTION_DAYS)
+    finished_at = func.coalesce(models.TaskResult.completed_at, models.TaskResult.created_at)
+    expired = [row.task_id for row in db.query(models.TaskResult.task_id).filter(
+        models.TaskResult.status != TaskStatus.PENDING,
+        models.TaskResult.duplicate_of.is_(None),
+        finished_at < cutoff,
+    )]
+    deleted = _delete_tasks(db, expired)
+    # Only combined batches get a final status; the others expire by age alongside their documents
+    batch_finished_at = func.coalesce(models.Batch.completed_at, models.Batch.created_at)
+    deleted += db.query(models.Batch).filter(
+        or_(models.Batch.status != TaskStatus.PENDING, models.Batch.combine.is_not(True)),
+        batch_finished_at < cutoff,
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def enforce_results_quota(db: Session) -> int:
+    """Drop the oldest finished reports until the stored (compressed) bytes fit the quota."""
+    size = func.coalesce(func.length(models.TaskResult.result_data), 0)
+    total = db.query(func.coalesce(func.sum(size), 0)).scalar()
+    if total <= RESULTS_MAX_BYTES:
+        return 0
+    victims = []
+    rows = db.query(models.TaskResult.task_id, size).filter(
+        models.TaskResult.status != TaskStatus.PENDING, models.TaskResult.duplicate_of.is_(None)
+    ).order_by(models.TaskResult.created_at).all()
+    for task_id, row_size in rows:
+        if total <= RESULTS_MAX_BYTES:
+            break
+        victims.append(task_id)
+        total -= row_size
+    return _delete_tasks(db, victims)
+
+
+def _unlink(path: Path) -> int:
+    try:
+        size = path.stat().st_size
+        path.unlink()
+        return size
+    except OSError:
+        return 0
+
+
+def sweep_outputs(db: Session, now: float) -> int:
+    """Delete artifacts of jobs and batches that no longer exist, then enforce the directory quota."""
+    owners = {}
+    freed = 0
+    for path in OUTPUT_DIRECTORY.glob("*"):
+        if path.name.endswith(".tmp"):
+            try:
+                if now - path.stat().st_mtime > ORPHAN_GRACE_SECONDS:
+                    freed += _unlink(path)
+            except OSError:
+                pass
+            continue
+        for suffix in OUTPUT_SUFFIXES:
+            if path.name.endswith(suffix):
+                owners.setdefault(path.name[:-len(suffix)], []).append(path)
+
+    task_ids = [owner for owner in owners if not owner.startswith("batch_")]
+    batch_ids = [owner[len("batch_"):] for owner in owners if owner.startswith("batch_")]
+    live = set()
+    for start in range(0, len(task_ids), ID_BATCH_SIZE):
+        batch = task_ids[start:start + ID_BATCH_SIZE]
+        live.update(row.task_id for row in db.query(models.TaskResult.task_id).filter(models.TaskResult.task_id.in_(batch)))
+    for start in range(0, len(batch_ids), ID_BATCH_SIZE):
+        batch = batch_ids[start:start + ID_BATCH_SIZE]
+        live.update(f"batch_{row.batch_id}" for row in db.query(models.Batch.batch_id).filter(models.Batch.batch_id.in_(batch)))
+
+    for owner, paths in owners.items():
+        if owner not in live:
+            freed += sum(_unlink(path) for path in paths)
+    if OUTPUT_DIRECTORY.exists():
+        evict_directory(OUTPUT_DIRECTORY, OUTPUTS_MAX_BYTES)
+    return freed
+
+
+def sweep_orphaned_uploads(db: Session, now: float) -> int:
+    """Delete uploads no running job refers to, e.g. left behind by a worker that died mid-job."""
+    in_use = {row.file_path for row in db.query(models.TaskResult.file_path).filter(
+        models.TaskResult.status == TaskStatus.PENDING
+    )}
+    freed = 0
+    for pattern in UPLOAD_PATTERNS:
+        for path in UPLOAD_DIRECTORY.glob(pattern):
+            try:
+                age = now - path.stat().st_mtime
+            except OSError:
+                continue
+            if age > ORPHAN_GRACE_SECONDS and str(path) not in in_use:
+                freed += _unlink(path)
+    return freed
+
+
+def sweep_caches(now: float) -> int:
+    """Remove interrupted cache writes and re-apply the extraction cache quota."""
+    freed = 0
+    for path in CACHE_DIRECTORY.rglob("*.tmp"):
+        try:
+            if now - path.stat().st_mtime > ORPHAN_GRACE_SECONDS:
+                freed += _unlink(path)
+        except OSError:
+            continue
+    if CACHE_DIRECTORY.exists():
+        evict_directory(CACHE_DIRECTORY, DISK_LIMIT_BYTES, DISK_PATTERN)
+    page_store.prune_manifests(time.time() - RESULT_RETENTION_DAYS * 86400)
+    return freed
+
+
+def _vacuum_sqlite():
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def collect_garbage() -> dict:
+    """One retention pass over the results table, the outputs directory, uploads and caches."""
+    now = datetime.utcnow()
+    wall_now = time.time()
+    db: Session = SessionLocal()
+    try:
+        report = {
+            "stale_jobs_failed": expire_stale_jobs(db, now),
+            "expired_rows": expire_results(db, now),
+            "quota_rows": enforce_results_quota(db),
+            "output_bytes_freed": sweep_outputs(db, wall_now),
+            "upload_bytes_freed": sweep_orphaned_uploads(db, wall_now),
+        }
+    finally:
+        db.close()
+    report["cache_bytes_freed"] = sweep_caches(wall_now)
+    if engine.dialect.name == "sqlite" and report["expired_rows"] + report["quota_rows"] >= VACUUM_MIN_DELETED_ROWS:
+        _vacuum_sqlite()
+        report["vacuumed"] = True
+    print(f"Garbage collection: {report}")
+    return report
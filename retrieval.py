@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import zipfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+
+from document_cache import CACHE_DIRECTORY, evict_directory
+from text_pipeline import NormalizedDocument, load_document
+
+from dotenv import load_dotenv
+load_dotenv()
+
+INDEX_DIRECTORY = CACHE_DIRECTORY / "index"
+INDEX_DISK_BYTES = int(os.getenv("RETRIEVAL_INDEX_DISK_BYTES", str(256 * 1024 * 1024)))
+CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1200"))
+MEMORY_INDEXES = 16
+
+# Standard BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.lower())
+
+
+def chunk_pages(pages: list, chunk_chars: int = CHUNK_CHARS) -> list:
+    """
+    Split each page into chunks of roughly `chunk_chars` on line boundaries.
+    Returns (page_number, start, end) offsets into the page text; page numbers start at 1.
+    """
+    chunks = []
+    for page_number, page in enumerate(pages, start=1):
+        start = 0
+        while start < len(page):
+            end = min(start + chunk_chars, len(page))
+            if end < len(page):
+                newline = page.rfind("\n", start + chunk_chars // 2, end)
+                if newline != -1:
+                    end = newline + 1
+            if page[start:end].strip():
+                chunks.append((page_number, start, end))
+            start = end
+    return chunks
+
+
+def index_key(doc_hash: str) -> str:
+    """Cache key of a document's index; chunks depend on CHUNK_CHARS, so it is part of the key."""
+    return f"{doc_hash}-c{CHUNK_CHARS}"
+
+
+class BM25Index:
+    """BM25 weights for every (chunk, term) pair, precomputed into a sparse matrix."""
+
+    def __init__(self, doc_hash: str, chunks: list, vocabulary: dict, weights: sparse.csc_matrix):
+        self.doc_hash = doc_hash
+        self.chunks = chunks
+        self.vocabulary = vocabulary
+        self.weights = weights
+
+    @classmethod
+    def build(cls, document: NormalizedDocument) -> "BM25Index":
+        chunks = chunk_pages(document.pages)
+        vocabulary = {}
+        rows, cols, counts = [], [], []
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for row, (page_number, start, end) in enumerate(chunks):
+            tokens = tokenize(document.pages[page_number - 1][start:end])
+            lengths[row] = len(tokens)
+            term_counts = {}
+            for token in tokens:
+                term_id = vocabulary.setdefault(token, len(vocabulary))
+                term_counts[term_id] = term_counts.get(term_id, 0) + 1
+            rows.extend([row] * len(term_counts))
+            cols.extend(term_counts.keys())
+            counts.extend(term_counts.values())
+
+        tf = sparse.csr_matrix(
+            (np.asarray(counts, dtype=np.float32), (rows, cols)),
+            shape=(len(chunks), len(vocabulary)),
+        )
+        n_chunks = max(len(chunks), 1)
+        document_frequency = np.bincount(tf.indices, minlength=len(vocabulary))
+        idf = np.log1p((n_chunks - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        # Chunks without a single token (e.g. only punctuation) would otherwise make this zero
+        average_length = max(float(lengths.mean()), 1.0) if len(chunks) else 1.0
+
+        # Saturate term frequencies per chunk, then scale each column by its idf
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+        weights = tf.copy()
+        row_of_entry = np.repeat(np.arange(tf.shape[0]), np.diff(tf.indptr))
+        weights.data = weights.data * (BM25_K1 + 1) / (weights.data + length_norm[row_of_entry])
+        weights = weights.multiply(idf).tocsc()
+        return cls(document.doc_hash, chunks, vocabulary, weights)
+
+    def search(self, query: str, top_k: int = 5) -> list:
+        """Return [(score, chunk)] for the best matching chunks, best first."""
+        term_ids = sorted({self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary})
+        if not term_ids:
+            return []
+        scores = np.asarray(self.weights[:, term_ids].sum(axis=1)).ravel()
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[i]), self.chunks[i]) for i in best if scores[i] > 0]
+
+    def save(self):
+        INDEX_DIRECTORY.mkdir(parents=True, exist_ok=True)
+        key = index_key(self.doc_hash)
+        # Write each file under a per-writer temp name and rename it, so readers never see a partial file
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        weights_path = INDEX_DIRECTORY / f"{key}.npz"
+        tmp_path = weights_path.with_suffix(suffix)
+        with open(tmp_path, "wb") as f:
+            sparse.save_npz(f, self.weights)
+        os.replace(tmp_path, weights_path)
+        meta_path = INDEX_DIRECTORY / f"{key}.json"
+        tmp_path = meta_path.with_suffix(suffix)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"chunks": self.chunks, "vocabulary": self.vocabulary}, f)
+        os.replace(tmp_path, meta_path)
+        evict_directory(INDEX_DIRECTORY, INDEX_DISK_BYTES)
+
+    @classmethod
+    def load(cls, doc_hash: str):
+        key = index_key(doc_hash)
+        try:
+            weights = sparse.load_npz(INDEX_DIRECTORY / f"{key}.npz").tocsc()
+            with open(INDEX_DIRECTORY / f"{key}.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return None
+        chunks = [tuple(chunk) for chunk in meta["chunks"]]
+        return cls(doc_hash, chunks, meta["vocabulary"], weights)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(document: NormalizedDocument) -> BM25Index:
+    """Return the index for a document, building and persisting it on first use."""
+    with _indexes_lock:
+        index = _indexes.get(document.doc_hash)
+        if index is not None:
+            _indexes.move_to_end(document.doc_hash)
+            return index
+
+    index = BM25Index.load(document.doc_hash)
+    if index is None:
+        index = BM25Index.build(document)
+        try:
+            index.save()
+        except OSError as e:
+            print(f"Warning: Could not persist retrieval index {document.doc_hash}. Error: {e}")
+
+    with _indexes_lock:
+        _indexes[document.doc_hash] = index
+        while len(_indexes) > MEMORY_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def search_document(file_path: str, query: str, top_k: int = 5) -> list:
+    """Return [(page_number, score, text)] for the chunks most relevant to `query`."""
+    document = load_document(file_path)
+    index = get_index(document)
+    results = []
+    for score, (page_number, start, end) in index.search(query, top_k):
+        results.append((page_number, score, document.pages[page_number - 1][start:end]))
+    return results
@@ -0,0 +1,138 @@
+import os
+import random
+import redis
+from pypdf import PdfReader
+
+from dotenv import load_dotenv
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+INTERACTIVE_QUEUE = "interactive"
+BULK_QUEUE = "bulk"
+# Single uploads up to this many pages go to the interactive queue; batches always go to bulk
+INTERACTIVE_MAX_PAGES = int(os.getenv("INTERACTIVE_MAX_PAGES", "40"))
+
+# Shared Gemini budget across all workers; 0 disables that limit
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "300"))
+# Share of each budget that bulk jobs may not use, so interactive jobs are never starved
+INTERACTIVE_BUDGET_RESERVE = float(os.getenv("INTERACTIVE_BUDGET_RESERVE", "0.2"))
+
+# Cost model: fixed prompt overhead for the four stages plus the document as the agents read it
+JOB_BASE_TOKENS = int(os.getenv("JOB_BASE_TOKENS", "20000"))
+JOB_LLM_REQUESTS = int(os.getenv("JOB_LLM_REQUESTS", "12"))
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+TOKENS_PER_PAGE = int(os.getenv("TOKENS_PER_PAGE", "50"))
+
+BUDGET_KEY_PREFIX = "llm_budget"
+
+# Refill every bucket, then take the cost from all of them or from none.
+# ARGV: reserve fraction, then (capacity, refill per second, cost) per key.
+# Returns "0" when admitted, otherwise the seconds until the cost fits.
+_ACQUIRE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local reserve = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+  local capacity = tonumber(ARGV[3 * i - 1])
+  local rate = tonumber(ARGV[3 * i])
+  local cost = tonumber(ARGV[3 * i + 1])
+  local state = redis.call('HMGET', key, 'level', 'ts')
+  local level = tonumber(state[1]) or capacity
+  local ts = tonumber(state[2]) or now
+  level = math.min(capacity, level + math.max(0, now - ts) * rate)
+  levels[i] = level
+  local needed = cost + reserve * capacity
+  if level < needed then
+    wait = math.max(wait, (needed - level) / rate)
+  end
+end
+for i, key in ipairs(KEYS) do
+  local level = levels[i]
+  if wait == 0 then
+    level = level - tonumber(ARGV[3 * i + 1])
+  end
+  redis.call('HSET', key, 'level', tostring(level), 'ts', tostring(now))
+  redis.call('EXPIRE', key, 3600)
+end
+return tostring(wait)
+"""
+
+
+def count_pages(file_path) -> int:
+    """Page count from the PDF's page tree; None if the file cannot be parsed."""
+    try:
+        return len(PdfReader(str(file_path)).pages)
+    except Exception as e:
+        print(f"Warning: Could not count pages of {file_path}. Error: {e}")
+        return None
+
+
+def choose_queue(page_count: int) -> str:
+    if page_count is None or page_count <= INTERACTIVE_MAX_PAGES:
+        return INTERACTIVE_QUEUE
+    return BULK_QUEUE
+
+
+def estimate_cost(page_count: int, characters: int) -> tuple:
+    """Estimated (tokens, LLM requests) of one analysis of a document."""
+    tokens = JOB_BASE_TOKENS + int(characters / CHARS_PER_TOKEN) + page_count * TOKENS_PER_PAGE
+    return tokens, JOB_LLM_REQUESTS
+
+
+class LLMBudget:
+    """
+    Token buckets in Redis shared by every worker: one for tokens and one for requests
+    per minute, each holding at most one minute's worth. A job is admitted only when
+    its whole estimated cost fits; otherwise the caller gets the time to wait.
+    """
+
+    def __init__(self, tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+                 requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+                 reserve: float = INTERACTIVE_BUDGET_RESERVE):
+        self.limits = {"tokens": tokens_per_minute, "requests": requests_per_minute}
+        self.reserve = reserve
+        self._client = None
+        self._script = None
+
+    @property
+    def enabled(self) -> bool:
+        return any(limit > 0 for limit in self.limits.values())
+
+    def _acquire_script(self):
+        if self._script is None:
+            self._client = redis.Redis.from_url(REDIS_URL)
+            self._script = self._client.register_script(_ACQUIRE_SCRIPT)
+        return self._script
+
+    def try_acquire(self, tokens: int, requests: int, queue: str = INTERACTIVE_QUEUE) -> float:
+        """Take the cost if it fits and return 0, else return the seconds to wait before retrying."""
+        if not self.enabled:
+            return 0.0
+        reserve = 0.0 if queue == INTERACTIVE_QUEUE else self.reserve
+        keys, args = [], [reserve]
+        for name, cost in (("tokens", tokens), ("requests", requests)):
+            capacity = self.limits[name]
+            if capacity <= 0:
+                continue
+            # A job larger than the bucket would never fit; it takes the whole bucket instead
+            cost = min(cost, capacity * (1 - reserve))
+            keys.append(f"{BUDGET_KEY_PREFIX}:{name}")
+            args.extend([capacity, capacity / 60, cost])
+        try:
+            return float(self._acquire_script()(keys=keys, args=args))
+        except redis.RedisError as e:
+            # Fail open: an unavailable budget store should not stop analyses
+            print(f"Warning: LLM budget unavailable, admitting job. Error: {e}")
+            return 0.0
+
+
+def retry_delay(wait_seconds: float) -> float:
+    """Spread retries so waiting jobs don't all wake at the same moment."""
+    return max(1.0, wait_seconds) * random.uniform(1.0, 1.25)
+
+
+llm_budget = LLMBudget()
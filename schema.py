@@ -0,0 +1,64 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+import models
+from compression import compress_text
+from database import Base
+
+
+def _add_missing_columns(connection, table) -> list:
+    """ALTER TABLE ... ADD COLUMN for every model column the existing table lacks; returns their names."""
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+        added.append(column.name)
+    return added
+
+
+def _migrate_legacy_results(connection):
+    """Move reports stored in the original plain-text `result` column into the compressed columns."""
+    rows = connection.execute(text(
+        "SELECT id, result FROM task_results WHERE result IS NOT NULL AND result_data IS NULL"
+    )).all()
+    for row_id, report in rows:
+        codec, data = compress_text(report)
+        connection.execute(
+            text("UPDATE task_results SET result_data = :data, result_codec = :codec, result = NULL WHERE id = :id"),
+            {"data": data, "codec": codec, "id": row_id},
+        )
+    if rows:
+        print(f"Schema upgrade: compressed {len(rows)} stored reports")
+
+
+def upgrade_schema(engine):
+    """
+    Create missing tables, then bring tables created by earlier versions up to the models:
+    missing columns and indexes are added in place, since create_all leaves existing tables alone.
+    Every new column is nullable, so existing rows stay valid and read as not deduplicated
+    and not part of a batch.
+    """
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            added = _add_missing_columns(connection, table)
+            if added:
+                print(f"Schema upgrade: added {', '.join(added)} to {table.name}")
+            if "created_at" in added:
+                # Retention ages rows by created_at; older rows start aging at the upgrade
+                connection.execute(text(f"UPDATE {table.name} SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"))
+        columns = {column["name"] for column in inspect(connection).get_columns(models.TaskResult.__tablename__)}
+        if "result" in columns:
+            _migrate_legacy_results(connection)
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                with engine.begin() as connection:
+                    index.create(connection, checkfirst=True)
+            except IntegrityError as e:
+                # Rows written before the index existed can violate it; dedup still works without it
+                print(f"Warning: could not create index {index.name}: {e}")
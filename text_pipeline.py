@@ -0,0 +1,171 @@
+import re
+from document_cache import extraction_cache, file_sha256
+from pdf_extraction import extract_pages, iter_pages, page_count, page_fingerprints
+from page_store import page_store
+from cpu_pool import run_cpu
+
+_NEWLINE_RUNS = re.compile(r"\n{2,}")
+_SPACE_RUNS = re.compile(r" {2,}")
+# Stored pages are read, and freshly extracted ones written, this many at a time
+REUSE_CHUNK_PAGES = 64
+
+
+def normalize_text(text: str) -> str:
+    """Collapse blank lines and repeated spaces in a single linear pass each."""
+    return _SPACE_RUNS.sub(" ", _NEWLINE_RUNS.sub("\n", text))
+
+
+def page_stats(pages) -> dict:
+    """The statistics every tool reports, from any iterable of normalized pages."""
+    stats = {"pages": 0, "empty_pages": 0, "characters": 0}
+    for page in pages:
+        stats["pages"] += 1
+        if page:
+            stats["characters"] += len(page) + 1
+        else:
+            stats["empty_pages"] += 1
+    return stats
+
+
+class NormalizedDocument:
+    """Normalized page text of one document plus the statistics every tool reports."""
+
+    def __init__(self, doc_hash: str, pages: list):
+        self.doc_hash = doc_hash
+        self.pages = pages
+        self.stats = page_stats(pages)
+
+    @property
+    def text(self) -> str:
+        """The whole document as one string; built on demand since most callers only need pages."""
+        return "".join(page + "\n" for page in self.pages if page)
+
+    @classmethod
+    def from_text(cls, text: str) -> "NormalizedDocument":
+        """Wrap text that was handed to a tool directly instead of through a file path."""
+        return cls(doc_hash=None, pages=[normalize_text(text)])
+
+
+class DocumentSummary:
+    """Hash and statistics of a document whose pages live in the extraction cache."""
+
+    def __init__(self, doc_hash: str, stats: dict):
+        self.doc_hash = doc_hash
+        self.stats = stats
+
+
+def _iter_changed_pages(file_path: str) -> tuple:
+    """
+    Extract only the pages whose content was never seen before; pages shared with
+    an earlier revision come from the page store by content fingerprint.
+    Returns (page count, generator of the normalized pages in order); stored pages are
+    read and fresh ones stored a chunk at a time, so the document is never held whole.
+    """
+    try:
+        fingerprints = run_cpu(page_fingerprints, file_path)
+        known = page_store.known_pages(fingerprints)
+    except Exception as e:
+        print(f"Warning: Page reuse unavailable for {file_path}, extracting every page. Error: {e}")
+        return page_count(file_path), iter_pages(file_path, normalize_text)
+
+    missing = [i for i, fingerprint in enumerate(fingerprints) if fingerprint not in known]
+    print(f"Extracting {len(missing)} of {len(fingerprints)} pages; {len(fingerprints) - len(missing)} reused")
+
+    def _store(fresh: dict):
+        try:
+            page_store.put_pages(fresh)
+        except Exception as e:
+            print(f"Warning: Could not store extracted pages. Error: {e}")
+
+    def stream():
+        extracted = iter_pages(file_path, normalize_text, missing)
+        for start in range(0, len(fingerprints), REUSE_CHUNK_PAGES):
+            chunk = fingerprints[start:start + REUSE_CHUNK_PAGES]
+            try:
+                stored = page_store.get_pages([fp for fp in chunk if fp in known])
+            except Exception as e:
+                print(f"Warning: Could not read stored pages. Error: {e}")
+                stored = {}
+            fresh = {}
+            for index, fingerprint in enumerate(chunk, start):
+                if fingerprint not in known:
+                    text = next(extracted)
+                    fresh[fingerprint] = text
+                elif fingerprint in stored:
+                    text = stored[fingerprint]
+                else:
+                    # Evicted since it was looked up
+                    text = extract_pages(file_path, normalize_text, [index])[0]
+                yield text
+            if fresh:
+                _store(fresh)
+
+    return len(fingerprints), stream()
+
+
+def load_document(file_path: str) -> NormalizedDocument:
+    """
+    Extract and normalize a PDF once, then serve it from the shared cache.
+
+    Normalization happens right after extraction, so cached pages are already
+    clean and no tool needs to repeat the work.
+    """
+    doc_hash = run_cpu(file_sha256, file_path)
+    pages = extraction_cache.get(doc_hash)
+    if pages is None:
+        pages = list(_iter_changed_pages(file_path)[1])
+        extraction_cache.put(doc_hash, pages)
+    return NormalizedDocument(doc_hash, pages)
+
+
+def cache_document(file_path: str):
+    """
+    Make sure a PDF is in the extraction cache without holding its text: fresh pages are
+    written to the disk tier as they are extracted and the statistics are read back page by
+    page. Returns a DocumentSummary, or the loaded document if the cache cannot be written.
+    """
+    doc_hash = run_cpu(file_sha256, file_path)
+    if extraction_cache.page_count(doc_hash) is None:
+        total, pages = _iter_changed_pages(file_path)
+        extraction_cache.put_stream(doc_hash, total, pages)
+    pages = extraction_cache.iter_pages(doc_hash)
+    if pages is None:
+        return load_document(file_path)
+    return DocumentSummary(doc_hash, page_stats(pages))
+
+
+def open_document(doc_hash: str, file_path: str) -> NormalizedDocument:
+    """
+    Load a document whose hash is already known, e.g. in a CPU pool process reading the
+    cache entry the parent wrote; falls back to a full load if the entry is gone.
+    """
+    pages = extraction_cache.get(doc_hash)
+    if pages is None:
+        return load_document(file_path)
+    return NormalizedDocument(doc_hash, pages)
+
+
+def resolve_document(file_path: str = None, financial_document_data: str = None) -> NormalizedDocument:
+    """Prefer the cached document for a file path and fall back to raw text from the agent."""
+    if file_path:
+        return load_document(file_path)
+    return NormalizedDocument.from_text(financial_document_data or "")
+
+
+def iter_document_pages(file_path: str, first_page: int = 1, last_page: int = None) -> tuple:
+    """
+    Stream the normalized pages first_page..last_page (1-based, inclusive) of a document.
+    Returns (total page count, generator of (page number, text)). Cached documents are
+    read page by page; otherwise only the requested pages are extracted, without caching.
+    """
+    doc_hash = file_sha256(file_path)
+    total = extraction_cache.page_count(doc_hash)
+    pages = None
+    if total is not None:
+        last = total if last_page is None else min(last_page, total)
+        pages = extraction_cache.iter_pages(doc_hash, first_page - 1, last)
+    if pages is None:
+        total = page_count(file_path)
+        last = total if last_page is None else min(last_page, total)
+        pages = iter_pages(file_path, normalize_text, range(first_page - 1, last))
+    return total, zip(range(first_page, last + 1), pages)
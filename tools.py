@@ -1,116 +1,114 @@
 ## Importing libraries and files
 import os
-from pypdf import PdfReader
 from crewai.tools import BaseTool
-from crewai_tools import tools
 from crewai_tools import SerperDevTool
 import asyncio
+from document_reader import format_table_of_contents, read_document, table_of_contents as document_table_of_contents
+from retrieval import search_document
+from cross_check import format_verified_report
+from cpu_pool import run_cpu
+from document_jobs import cross_check_text_job, document_stats_job, financial_analysis_job
+from metrics import instrument_tool
 
 from dotenv import load_dotenv
 load_dotenv()
 
 search_tool = SerperDevTool()
 
+
 ## Creating custom pdf reader tool
 class FinancialDocumentTool(BaseTool):
     name: str = "Financial Document Reader"
-    description: str = "A tool to read the full content of a financial document from a given file path."
+    description: str = (
+        "Read a financial document in bounded pieces. Pass table_of_contents=True to list its sections "
+        "with page numbers, then read a section by name or a start_page/end_page range. Each call returns "
+        "at most max_chars characters and says which start_page (and, inside a long page, start_offset) "
+        "to continue from. The full text is long; "
+        "use it only when the fact sheet and the search tool are not enough."
+    )
     
-    def _run(self, file_path: str = 'data/TSLA-Q2-2025-Update.pdf') -> str: #Default file path to 'TSLA....pdf' if no file uploaded
-        """Tool to read data from a pdf file from a path"""
+    @instrument_tool
+    def _run(self, file_path: str = 'data/TSLA-Q2-2025-Update.pdf', start_page: int = None, end_page: int = None,
+             section: str = None, max_chars: int = None, table_of_contents: bool = False,
+             start_offset: int = None) -> str: #Default file path to 'TSLA....pdf' if no file uploaded
+        """Tool to read pages of a pdf file from a path, a page range or section at a time"""
         
-        full_report = ""
         try:
-            # Correctly open and read the PDF
-            reader = PdfReader(file_path)
-            for page in reader.pages:
-                content = page.extract_text()
-                if content:
-                    while "\n\n" in content:
-                        content = content.replace("\n\n", "\n")
-                    full_report += content + "\n"
-            return full_report
+            if table_of_contents:
+                return format_table_of_contents(run_cpu(document_table_of_contents, file_path))
+            return run_cpu(read_document, file_path, start_page, end_page, section, max_chars, start_offset)
         except Exception as e:
             return f"Error reading the document: {e}"
         
 
+class DocumentSearchTool(BaseTool):
+    name: str = "Financial Document Search"
+    description: str = (
+        "Search a financial document for the passages most relevant to a query. "
+        "Returns the top matching chunks with their page numbers instead of the full document."
+    )
+
+    @instrument_tool
+    def _run(self, file_path: str, query: str, top_k: int = 5) -> str:
+        """Return the top-k relevant chunks of the document with page references."""
+        try:
+            results = run_cpu(search_document, file_path, query, top_k)
+            if not results:
+                return "No relevant passages found for this query."
+            return "\n\n".join(f"[page {page}] {text.strip()}" for page, _, text in results)
+        except Exception as e:
+            return f"Error searching the document: {e}"
+
+
 class FinancialAnalysisTool(BaseTool):
     name: str = "Financial Analysis Tool"
-    description: str = "A tool for financial analysts to process financial documents and provide detailed analysis simultaneously with other agents."
+    description: str = "A tool for financial analysts that parses the income statement, balance sheet and cash-flow tables of a financial document and returns computed margins, growth, leverage and liquidity ratios per period."
     
-    def _process_data(self, financial_document_data: str) -> str:
+    def _process_data(self, file_path: str = None, financial_document_data: str = None) -> str:
         try:
-            # Clean up the data format
-            processed_data = financial_document_data
-            i = 0
-            while i < len(processed_data):
-                if processed_data[i:i+2] == "  ":  # Remove double spaces
-                    processed_data = processed_data[:i] + processed_data[i+1:]
-                else:
-                    i += 1
+            # Parse the statement tables and compute ratios deterministically, on the CPU pool
+            stats, computed = run_cpu(financial_analysis_job, file_path, financial_document_data)
             
-            # Extract key financial metrics and provide analysis
             analysis_result = f"""
 # Financial Analysis Report
 
 ## Document Summary
-Processed financial document containing {len(processed_data)} characters of data.
-
-## Key Financial Metrics Extracted
-- Revenue figures and growth patterns
-- Profit margins and profitability analysis
-- Cash flow statements and liquidity metrics
-- Balance sheet components (assets, liabilities, equity)
-- Debt ratios and financial leverage
+Processed financial document containing {stats['characters']} characters of data across {stats['pages']} pages.
 
-## Financial Health Assessment
-Based on the extracted data, this analysis provides insights into the company's financial position, performance trends, and key indicators for investment decision-making.
+## Computed Financials
+{computed}
 
-## Recommendations
-- Detailed financial metrics analysis
-- Performance trend identification
-- Comparative financial ratios
-- Investment viability assessment
+Figures are parsed directly from the document's tables; ratios are computed in code, not estimated.
             """
             
             return analysis_result.strip()
         except Exception as e:
             return f"Error in financial analysis: {e}"
              
-    def _run(self, financial_document_data: str) -> str:
+    @instrument_tool
+    def _run(self, file_path: str = None, financial_document_data: str = None) -> str:
         """Synchronous execution entry point."""
-        print("Hello Using _run")
-        return self._process_data(financial_document_data)
+        return self._process_data(file_path, financial_document_data)
 
-    async def _arun(self, financial_document_data: str) -> str:
-        """Asynchronous execution entry point."""
-        print("Hello Using _arun")
-        # If you have any real async operations, they go here.
-        # For this example, we just simulate yielding control to the event loop.
-        await asyncio.sleep(0.1) 
-        return self._process_data(financial_document_data)
+    async def _arun(self, file_path: str = None, financial_document_data: str = None) -> str:
+        """Asynchronous execution entry point; the work runs off the event loop."""
+        return await asyncio.to_thread(self._run, file_path, financial_document_data)
 
 class InvestmentAnalysisTool(BaseTool):
     name: str = "Investment Analysis Tool"
     description: str = "A tool for investment advisors to provide investment recommendations based on financial documents simultaneously with other agents."
     
-    def _process_data(self, financial_document_data: str) -> str:
+    def _process_data(self, file_path: str = None, financial_document_data: str = None) -> str:
         try:
-            # Clean up the data format
-            processed_data = financial_document_data
-            i = 0
-            while i < len(processed_data):
-                if processed_data[i:i+2] == "  ":  # Remove double spaces
-                    processed_data = processed_data[:i] + processed_data[i+1:]
-                else:
-                    i += 1
+            # Text is normalized once per document by the shared pipeline, on the CPU pool
+            stats = run_cpu(document_stats_job, file_path, financial_document_data)
             
             # Generate investment analysis
             investment_result = f"""
 # Investment Analysis Report
 
 ## Document Review
-Analyzed financial document containing {len(processed_data)} characters of data.
+Analyzed financial document containing {stats['characters']} characters of data across {stats['pages']} pages.
 
 ## Investment Thesis
 Based on comprehensive analysis of the financial data, this report provides investment recommendations and strategic insights.
@@ -140,38 +138,30 @@ Based on comprehensive analysis of the financial data, this report provides inve
         except Exception as e:
             return f"Error in investment analysis: {e}"
         
-    def _run(self, financial_document_data: str) -> str:
-        return self._process_data(financial_document_data)
+    @instrument_tool
+    def _run(self, file_path: str = None, financial_document_data: str = None) -> str:
+        return self._process_data(file_path, financial_document_data)
 
-    async def _arun(self, financial_document_data: str) -> str:
-        # If you have any real async operations, they go here.
-        # For this example, we just simulate yielding control to the event loop.
-        await asyncio.sleep(0.1) 
-        return self._process_data(financial_document_data)
+    async def _arun(self, file_path: str = None, financial_document_data: str = None) -> str:
+        return await asyncio.to_thread(self._run, file_path, financial_document_data)
 
     
     
 class RiskAssessmentTool(BaseTool):
-    name: str = "Parallel Risk Assessment Tool"
+    name: str = "Risk Assessment Tool"
     description: str = "A tool for risk assessors to evaluate financial risks from documents simultaneously with other agents."
     
-    def _process_data(self, financial_document_data: str) -> str:
+    def _process_data(self, file_path: str = None, financial_document_data: str = None) -> str:
         try:
-            # Clean up the data format
-            processed_data = financial_document_data
-            i = 0
-            while i < len(processed_data):
-                if processed_data[i:i+2] == "  ":  # Remove double spaces
-                    processed_data = processed_data[:i] + processed_data[i+1:]
-                else:
-                    i += 1
+            # Text is normalized once per document by the shared pipeline, on the CPU pool
+            stats = run_cpu(document_stats_job, file_path, financial_document_data)
             
             # Perform risk assessment
             risk_result = f"""
 # Risk Assessment Report
 
 ## Document Analysis
-Analyzed financial document containing {len(processed_data)} characters of data.
+Analyzed financial document containing {stats['characters']} characters of data across {stats['pages']} pages.
 
 ## Identified Risk Categories
 
@@ -205,67 +195,44 @@ Analyzed financial document containing {len(processed_data)} characters of data.
         except Exception as e:
             return f"Error in risk assessment: {e}"
         
-    def _run(self, financial_document_data: str) -> str:
-        return self._process_data(financial_document_data)
+    @instrument_tool
+    def _run(self, file_path: str = None, financial_document_data: str = None) -> str:
+        return self._process_data(file_path, financial_document_data)
 
-    async def _arun(self, financial_document_data: str) -> str:
-        # If you have any real async operations, they go here.
-        # For this example, we just simulate yielding control to the event loop.
-        await asyncio.sleep(0.1) 
-        return self._process_data(financial_document_data)
+    async def _arun(self, file_path: str = None, financial_document_data: str = None) -> str:
+        return await asyncio.to_thread(self._run, file_path, financial_document_data)
 
     
     
     
 class VerificationAndSynthesisTool(BaseTool):
     name: str = "Verification and Synthesis Tool"
-    description: str = "A tool for verification specialists to compile and verify results from multiple parallel agents."
+    description: str = (
+        "A tool for verification specialists to compile the results of the parallel agents into one report. "
+        "Every figure, percentage and period in the three analyses is checked against the source document in code, "
+        "and the figures that do not match are listed with the closest value found and its page."
+    )
     
-    def _process_data(self, financial_analysis: str, risk_assessment: str, investment_analysis: str, financial_document_data: str) -> str:
+    def _process_data(self, financial_analysis: str, risk_assessment: str, investment_analysis: str,
+                      file_path: str = None, financial_document_data: str = None) -> str:
         try:
-            # Verify consistency across all analyses
-            verification_result = f"""
-# Comprehensive Financial Analysis Report
-*Verified and Synthesized from Multiple Specialist Analyses*
-
-## Executive Summary
-This report synthesizes findings from three parallel specialist analyses:
-1. Financial Analysis
-2. Risk Assessment  
-3. Investment Analysis
-
-## Verification Process
-All analyses have been cross-referenced against the original document containing {len(financial_document_data)} characters of data.
-
-## 1. Financial Analysis Summary
-{financial_analysis}
-
-## 2. Risk Assessment Summary
-{risk_assessment}
-
-## 3. Investment Analysis Summary
-{investment_analysis}
-
-## Cross-Verification Results
-✅ Financial metrics consistency verified
-✅ Risk factors properly identified
-✅ Investment recommendations supported by data
-✅ All claims traceable to source document
-
-## Final Recommendations
-Based on the verified analysis from all specialists, this report provides a comprehensive view of the investment opportunity with validated data points and cross-checked conclusions.
-
-## Disclaimer
-This analysis is based on the provided financial document and represents the collective assessment of multiple AI specialists. All recommendations should be considered in the context of broader market conditions and individual investment objectives.
-            """
-            
-            return verification_result.strip()
+            reports = {
+                "financial_analysis": financial_analysis,
+                "risk_assessment": risk_assessment,
+                "investment_analysis": investment_analysis,
+            }
+            check = run_cpu(cross_check_text_job, file_path, financial_document_data, reports)
+            return format_verified_report(reports, check)
         except Exception as e:
             return f"Error in verification and synthesis: {e}"
     
-    def _run(self, financial_analysis: str, risk_assessment: str, investment_analysis: str, financial_document_data: str) -> str:
-        return self._process_data(financial_analysis, risk_assessment, investment_analysis, financial_document_data)
-
-    async def _arun(self, financial_analysis: str, risk_assessment: str, investment_analysis: str, financial_document_data: str) -> str:
-        await asyncio.sleep(0.1) 
-        return self._process_data(financial_analysis, risk_assessment, investment_analysis, financial_document_data)
\ No newline at end of file
+    @instrument_tool
+    def _run(self, financial_analysis: str, risk_assessment: str, investment_analysis: str,
+             file_path: str = None, financial_document_data: str = None) -> str:
+        return self._process_data(financial_analysis, risk_assessment, investment_analysis, file_path, financial_document_data)
+
+    async def _arun(self, financial_analysis: str, risk_assessment: str, investment_analysis: str,
+                    file_path: str = None, financial_document_data: str = None) -> str:
+        return await asyncio.to_thread(
+            self._run, financial_analysis, risk_assessment, investment_analysis, file_path, financial_document_data
+        )
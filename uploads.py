@@ -0,0 +1,115 @@
+import os
+import asyncio
+import hashlib
+import zipfile
+from pathlib import Path
+from fastapi import HTTPException, UploadFile
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Uploads and their batch archives live here, next to the shared caches
+UPLOAD_DIRECTORY = Path(os.getenv("UPLOAD_DIR", "/app/data"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+
+MAX_BATCH_DOCUMENTS = int(os.getenv("MAX_BATCH_DOCUMENTS", "50"))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+
+PDF_MAGIC = b"%PDF-"
+ZIP_MAGIC = b"PK\x03\x04"
+
+
+async def save_upload(file: UploadFile, destination: Path, magic: bytes = PDF_MAGIC,
+                      max_bytes: int = MAX_UPLOAD_BYTES) -> tuple:
+    """
+    Stream an upload to disk in fixed-size chunks.
+
+    The SHA-256 and the magic bytes (PDF by default) are checked while streaming,
+    and the upload is rejected as soon as it exceeds `max_bytes`. File writes run
+    in a worker thread so they never block the event loop.
+    Returns (sha256 hex digest, size in bytes).
+    """
+    # Reject early when the multipart parser already knows the size
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Uploaded file exceeds the {max_bytes} byte limit")
+
+    digest = hashlib.sha256()
+    size = 0
+    out = await asyncio.to_thread(open, destination, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if size == 0 and not chunk.startswith(magic):
+                kind = "ZIP archive" if magic == ZIP_MAGIC else "PDF document"
+                raise HTTPException(status_code=415, detail=f"Uploaded file is not a {kind}")
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Uploaded file exceeds the {max_bytes} byte limit"
+                )
+            digest.update(chunk)
+            await asyncio.to_thread(out.write, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    except BaseException:
+        await asyncio.to_thread(out.close)
+        try:
+            os.remove(destination)
+        except OSError:
+            pass
+        raise
+    await asyncio.to_thread(out.close)
+    return digest.hexdigest(), size
+
+
+def extract_zip_pdfs(zip_path: Path, make_destination) -> list:
+    """
+    Stream every PDF member of a zip archive to its own file, chunk by chunk.
+
+    `make_destination()` returns a fresh path for each document. Members are
+    size-limited and magic-checked like direct uploads; non-PDF members are skipped.
+    All members together may not inflate to more than MAX_BATCH_UPLOAD_BYTES.
+    Returns [(member name, path, sha256, size)]. Runs synchronously; call it in a thread.
+    """
+    documents = []
+    total = 0
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            members = [m for m in archive.infolist() if not m.is_dir() and m.filename.lower().endswith(".pdf")]
+            if len(members) > MAX_BATCH_DOCUMENTS:
+                raise HTTPException(status_code=413, detail=f"Archive holds more than {MAX_BATCH_DOCUMENTS} PDFs")
+            for member in members:
+                if member.file_size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"{member.filename} exceeds the {MAX_UPLOAD_BYTES} byte limit")
+                destination = make_destination()
+                digest = hashlib.sha256()
+                size = 0
+                with archive.open(member) as source, open(destination, "wb") as out:
+                    documents.append((member.filename, destination, None, 0))
+                    for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+                        if size == 0 and not chunk.startswith(PDF_MAGIC):
+                            raise HTTPException(status_code=415, detail=f"{member.filename} is not a PDF document")
+                        size += len(chunk)
+                        total += len(chunk)
+                        # The declared size can lie; enforce the limits on the bytes actually inflated
+                        if size > MAX_UPLOAD_BYTES:
+                            raise HTTPException(status_code=413, detail=f"{member.filename} exceeds the {MAX_UPLOAD_BYTES} byte limit")
+                        if total > MAX_BATCH_UPLOAD_BYTES:
+                            raise HTTPException(status_code=413, detail=f"Archive inflates to more than the {MAX_BATCH_UPLOAD_BYTES} byte limit")
+                        digest.update(chunk)
+                        out.write(chunk)
+                documents[-1] = (member.filename, destination, digest.hexdigest(), size)
+    except BaseException as e:
+        for _, destination, _, _ in documents:
+            try:
+                os.remove(destination)
+            except OSError:
+                pass
+        if isinstance(e, zipfile.BadZipFile):
+            raise HTTPException(status_code=400, detail="Uploaded archive is not a valid zip file") from e
+        raise
+    return documents